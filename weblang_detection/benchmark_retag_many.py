@@ -0,0 +1,48 @@
+# Benchmark of scoring the files from folder "kirjak_vs_mittekirjak_ettenten_tagged" with ParagraphWebLanguageScoreRetagger.
+# Compares retag (one text at a time) with retag_many using different batch sizes, and reports texts and words per second.
+# Also checks that retag_many gives the same per-paragraph scores as retag.
+
+import argparse
+from time import perf_counter
+from estnltk.converters import json_to_text
+from packed_corpus import iter_documents
+from paragraphweblanguagescoreretagger import ParagraphWebLanguageScoreRetagger
+
+
+arg_parser = argparse.ArgumentParser(description='Benchmark of ParagraphWebLanguageScoreRetagger.retag_many.')
+arg_parser.add_argument('--in_dir', default='kirjak_vs_mittekirjak_ettenten_tagged',
+                        help='folder of tagged json-files (output of process_and_save_results.py) or a packed corpus of them')
+arg_parser.add_argument('--batch_sizes', type=int, nargs='+', default=[1, 10, 50, 220], help='batch sizes of retag_many')
+args = arg_parser.parse_args()
+
+documents=[json_text for file, json_text in iter_documents(args.in_dir)]
+
+def load_texts():
+    # texts are loaded again for every run, because a retagged paragraphs layer already has the score attributes
+    return [json_to_text(json_text) for json_text in documents]
+
+weblang_tagger=ParagraphWebLanguageScoreRetagger(use_punct_reps=True, use_missing_commas=True)
+
+def paragraph_scores(texts):
+    return [[list(text.paragraphs[attr]) for attr in weblang_tagger.output_attributes] for text in texts]
+
+texts=load_texts()
+words=sum(len(text.words) for text in texts)
+print("Files:",len(texts),"words:",words,"\n")
+
+# the first run also starts the Java process of the ClauseSegmenter
+start=perf_counter()
+for text in texts:
+    weblang_tagger.retag(text)
+elapsed=perf_counter()-start
+reference=paragraph_scores(texts)
+print("retag")
+print("  time: {:.3f} s, {:.1f} texts/sec, {:.0f} words/sec".format(elapsed, len(texts)/elapsed, words/elapsed))
+
+for batch_size in args.batch_sizes:
+    texts=load_texts()
+    start=perf_counter()
+    weblang_tagger.retag_many(texts, batch_size=batch_size)
+    elapsed=perf_counter()-start
+    print("retag_many, batch_size =",batch_size, "(same scores as retag)" if paragraph_scores(texts)==reference else "(DIFFERENT scores from retag)")
+    print("  time: {:.3f} s, {:.1f} texts/sec, {:.0f} words/sec".format(elapsed, len(texts)/elapsed, words/elapsed))
@@ -0,0 +1,95 @@
+# Benchmark of how the time of paragraphweblanguagescoreretagger grows with the size of the text.
+# Builds synthetic documents (by default 1k, 10k, 100k and 1M words) by replicating and shuffling paragraphs of files
+# from folder "kirjak_vs_mittekirjak_ettenten", and times ParagraphWebLanguageScoreRetagger.retag with every use_* flag separately.
+# Fits the scaling exponent b of time ~ words^b for every flag; exits with an error if some detector grows superlinearly
+# (b > --max_exponent), so that quadratic slowdowns are noticed.
+
+import os
+import gc
+import json
+import random
+import argparse
+import numpy as np
+from time import perf_counter
+from estnltk import Text
+from estnltk.converters import text_to_dict, dict_to_text
+from paragraphweblanguagescoreretagger import ParagraphWebLanguageScoreRetagger
+
+
+arg_parser = argparse.ArgumentParser(description='Scaling benchmark of paragraphweblanguagescoreretagger on synthetic large documents.')
+arg_parser.add_argument('--in_dir', default='kirjak_vs_mittekirjak_ettenten', help='folder of json-files')
+arg_parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000], help='sizes of documents in words')
+arg_parser.add_argument('--repeats', type=int, default=1, help='how many times every document is retagged (the best time is used)')
+arg_parser.add_argument('--max_exponent', type=float, default=1.15, help='largest allowed scaling exponent')
+arg_parser.add_argument('--seed', type=int, default=1, help='seed for shuffling paragraphs')
+args = arg_parser.parse_args()
+if len(args.sizes) < 2:
+    arg_parser.error('at least two sizes are needed for fitting the exponent')
+
+flags=['use_unknown_words','use_emoticons','use_letter_reps','use_punct_reps','use_capital_letters',
+       'use_missing_commas','use_ignored_capital','use_no_spaces','use_incorrect_spaces','use_foreign_letters']
+
+# tagger configurations: only word counting, every flag separately and all flags together
+configurations={'word_count': {flag: False for flag in flags}}
+for flag in flags:
+    configurations[flag]={f: f == flag for f in flags}
+configurations['all']={flag: True for flag in flags}
+
+paragraphs=[]
+for file in sorted(os.listdir(args.in_dir)):
+    if file.endswith(".json"):
+        with open(os.path.join(args.in_dir, file), 'r', encoding='utf-8') as f:
+            paragraphs.extend(p.strip() for p in json.load(f)["text"].split("\n\n") if p.strip())
+
+def make_document(size, rng):
+    """Returns the text of a document with at least size words, made of shuffled paragraphs."""
+    document=[]
+    words=0
+    while words < size:
+        shuffled=paragraphs[:]
+        rng.shuffle(shuffled)
+        for p in shuffled:
+            document.append(p)
+            words+=len(p.split())
+            if words >= size:
+                break
+    return "\n\n".join(document)
+
+rng=random.Random(args.seed)
+times={name: [] for name in configurations}
+word_counts=[]
+
+for size in args.sizes:
+    text=Text(make_document(size, rng))
+    text.tag_layer(['paragraphs', 'compound_tokens', 'clauses'])
+    word_counts.append(len(text.words))
+    print("Document of",len(text.words),"words,",len(text.paragraphs),"paragraphs")
+    text_dict=text_to_dict(text)
+    del text
+    for name, configuration in configurations.items():
+        tagger=ParagraphWebLanguageScoreRetagger(**configuration)
+        best=None
+        for i in range(args.repeats):
+            text=dict_to_text(text_dict) # retagging adds attributes, so every run gets a new copy
+            gc.collect()
+            start=perf_counter()
+            tagger.retag(text)
+            elapsed=perf_counter()-start
+            best=elapsed if best is None else min(best, elapsed)
+            del text
+        times[name].append(best)
+        print("  {:<22}{:>10.3f} s".format(name, best))
+
+print()
+print("{:<22}{:>10}".format("configuration", "exponent"))
+superlinear=[]
+for name, name_times in times.items():
+    # slope of the line fitted to log(time) ~ log(words)
+    exponent=np.polyfit(np.log(word_counts), np.log(name_times), 1)[0]
+    print("{:<22}{:>10.2f}".format(name, exponent))
+    if exponent > args.max_exponent:
+        superlinear.append(name)
+
+if superlinear:
+    print("Superlinear growth (exponent above {}):".format(args.max_exponent), ", ".join(superlinear))
+    raise SystemExit(1)
@@ -0,0 +1,69 @@
+# Load test of scoring_service.py on localhost: sends the texts of files from folder "kirjak_vs_mittekirjak_ettenten"
+# to a running service with --concurrency parallel clients, and reports throughput, latencies and statistics of the service.
+# Start the service first, e.g. "python scoring_service.py --port 8080" or "python scoring_service.py --socket /tmp/weblang.sock".
+
+import os
+import json
+import socket
+import argparse
+import http.client
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+arg_parser = argparse.ArgumentParser(description='Load test of the local scoring service.')
+arg_parser.add_argument('--in_dir', default='kirjak_vs_mittekirjak_ettenten', help='folder of json-files')
+arg_parser.add_argument('--host', default='127.0.0.1', help='host of the service')
+arg_parser.add_argument('--port', type=int, default=8080, help='port of the service')
+arg_parser.add_argument('--socket', default=None, help='Unix socket of the service (instead of the host and port)')
+arg_parser.add_argument('--concurrency', type=int, default=16, help='number of parallel clients')
+arg_parser.add_argument('--endpoint', default='/score', choices=['/score', '/normalize'], help='endpoint to test')
+args = arg_parser.parse_args()
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection over a Unix socket."""
+
+    def __init__(self, path):
+        super().__init__('localhost')
+        self.path=path
+
+    def connect(self):
+        self.sock=socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def request(method, path, body=None):
+    connection=UnixHTTPConnection(args.socket) if args.socket else http.client.HTTPConnection(args.host, args.port)
+    try:
+        connection.request(method, path, body=None if body is None else json.dumps(body).encode('utf-8'),
+                           headers={'Content-Type': 'application/json'})
+        response=connection.getresponse()
+        return response.status, json.loads(response.read().decode('utf-8'))
+    finally:
+        connection.close()
+
+def send(t):
+    start=perf_counter()
+    status, response=request('POST', args.endpoint, {'text': t})
+    return status, perf_counter()-start
+
+texts=[]
+for file in sorted(os.listdir(args.in_dir)):
+    if file.endswith(".json"):
+        with open(os.path.join(args.in_dir, file), 'r', encoding='utf-8') as f:
+            texts.append(json.load(f)["text"])
+
+start=perf_counter()
+with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+    results=list(executor.map(send, texts))
+elapsed=perf_counter()-start
+
+latencies=sorted(latency for status, latency in results)
+errors=sum(status != 200 for status, latency in results)
+print("Texts:",len(texts),"errors:",errors,"concurrency:",args.concurrency)
+print("Time: {:.2f} s, {:.1f} texts/sec".format(elapsed, len(texts)/elapsed))
+for p in (50, 90, 99):
+    print("Latency p{}: {:.1f} ms".format(p, 1000*latencies[min(len(latencies)-1, -(-p*len(latencies)//100)-1)]))
+print("Statistics of the service:")
+print(json.dumps(request('GET', '/stats')[1], indent=1))
@@ -0,0 +1,73 @@
+# Benchmark of the startup time of paragraphweblanguagescoreretagger and NormalizeWordsRetagger.
+# Every measurement is made in a new Python process, so that nothing is cached from earlier measurements:
+#   - import time of the modules (from "python -X importtime"), with the slowest top-level imports;
+#   - time of importing, making the retagger, the first retag (taggers are made on first use) and the second retag
+#     of a file from folder "kirjak_vs_mittekirjak_ettenten_tagged".
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+
+arg_parser = argparse.ArgumentParser(description='Benchmark of import time and first-call latency of the retaggers.')
+arg_parser.add_argument('--in_dir', default='kirjak_vs_mittekirjak_ettenten_tagged',
+                        help='folder of tagged json-files (output of process_and_save_results.py)')
+arg_parser.add_argument('--top', type=int, default=10, help='number of the slowest imports shown')
+args = arg_parser.parse_args()
+
+here=os.path.dirname(os.path.abspath(__file__))
+normalization_dir=os.path.join(here, '..', 'weblang_normalization')
+
+def import_times(module, path):
+    """Imports a module in a new process. Returns the cumulative import time of the module (microseconds) 
+       and a list of (cumulative time, name) of the modules imported directly by the module, slowest first."""
+    code='import sys; sys.path.insert(0, {!r}); import {}'.format(path, module)
+    result=subprocess.run([sys.executable, '-X', 'importtime', '-c', code], stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    children=[]
+    for line in result.stderr.splitlines():
+        # lines are "import time: self [us] | cumulative | imported package"; imports made by a module are listed 
+        # before the module and are indented by two spaces for every level
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_time, cumulative, name=line[len('import time:'):].split('|')
+        level=(len(name) - len(name.lstrip()) - 1) // 2
+        if level == 0:
+            if name.strip() == module:
+                return int(cumulative), sorted(children, reverse=True)
+            children=[]
+        elif level == 1:
+            children.append((int(cumulative), name.strip()))
+    return 0, []
+
+for module, path in (('paragraphweblanguagescoreretagger', here), ('NormalizeWordsRetagger', normalization_dir)):
+    total, times=import_times(module, path)
+    print("import {}: {:.3f} s".format(module, total/1e6))
+    for t, name in times[:args.top]:
+        print("  {:<50}{:>10.3f} s".format(name, t/1e6))
+    print()
+
+# time of the phases in a new process
+phases_code='''
+import sys, json
+from time import perf_counter
+start=perf_counter()
+from estnltk.converters import json_to_text
+from paragraphweblanguagescoreretagger import ParagraphWebLanguageScoreRetagger
+imported=perf_counter()
+tagger=ParagraphWebLanguageScoreRetagger()
+made=perf_counter()
+times=[]
+for i in range(2):
+    text=json_to_text(file=sys.argv[1])
+    retag_start=perf_counter()
+    tagger.retag(text)
+    times.append(perf_counter()-retag_start)
+print(json.dumps({"import": imported-start, "make retagger": made-imported, "first retag": times[0], "second retag": times[1]}))
+'''
+file=os.path.join(args.in_dir, sorted(f for f in os.listdir(args.in_dir) if f.endswith(".json"))[0])
+result=subprocess.run([sys.executable, '-c', phases_code, file], cwd=here, stdout=subprocess.PIPE, universal_newlines=True, check=True)
+print("ParagraphWebLanguageScoreRetagger, file", os.path.basename(file))
+for phase, t in json.loads(result.stdout.strip().splitlines()[-1]).items():
+    print("  {:<20}{:>10.3f} s".format(phase, t))
@@ -0,0 +1,75 @@
+# Benchmark of the container format of text_container.py against EstNLTK JSON export files.
+# Saves the tagged files from folder "kirjak_vs_mittekirjak_ettenten_tagged" into a container, checks that every
+# document is read back unchanged, and reports the size of both formats and the time of loading all documents
+# (as dicts and as Text objects).
+
+import os
+import json
+import shutil
+import argparse
+import tempfile
+from time import perf_counter
+from estnltk.converters import json_to_text
+from text_container import TextContainerWriter, TextContainerReader
+
+
+arg_parser = argparse.ArgumentParser(description='Compares the size and load time of the container format and JSON files.')
+arg_parser.add_argument('--in_dir', default='kirjak_vs_mittekirjak_ettenten_tagged',
+                        help='folder of tagged json-files (output of process_and_save_results.py)')
+arg_parser.add_argument('--shard_size', type=int, default=1000, help='number of documents in a shard')
+arg_parser.add_argument('--compression', default=None, choices=['gzip', 'zstd'],
+                        help='compression of the documents (by default zstd if the module zstandard is installed, otherwise gzip)')
+args = arg_parser.parse_args()
+
+files=[file for file in sorted(os.listdir(args.in_dir)) if file.endswith(".json")]
+out_dir=tempfile.mkdtemp()
+
+try:
+    start=perf_counter()
+    with TextContainerWriter(out_dir, shard_size=args.shard_size, compression=args.compression) as writer:
+        compression=writer.compression
+        for file in files:
+            with open(os.path.join(args.in_dir, file), 'r', encoding='utf-8') as f:
+                writer.add(file, json.load(f))
+    write_time=perf_counter()-start
+
+    json_size=sum(os.path.getsize(os.path.join(args.in_dir, file)) for file in files)
+    container_size=sum(os.path.getsize(os.path.join(out_dir, file)) for file in os.listdir(out_dir))
+
+    times={}
+    start=perf_counter()
+    json_dicts={}
+    for file in files:
+        with open(os.path.join(args.in_dir, file), 'r', encoding='utf-8') as f:
+            json_dicts[file]=json.load(f)
+    times["JSON, dicts"]=perf_counter()-start
+
+    with TextContainerReader(out_dir) as reader:
+        start=perf_counter()
+        container_dicts={file: reader.text_dict(file) for file in files}
+        times["container, dicts"]=perf_counter()-start
+        differences=[file for file in files if json_dicts[file] != container_dicts[file]]
+        del json_dicts, container_dicts
+
+        start=perf_counter()
+        for file in files:
+            json_to_text(file=os.path.join(args.in_dir, file))
+        times["JSON, Text objects"]=perf_counter()-start
+
+        start=perf_counter()
+        for file, text in reader.texts():
+            pass
+        times["container, Text objects"]=perf_counter()-start
+finally:
+    shutil.rmtree(out_dir)
+
+print("Documents:",len(files),"shard size:",args.shard_size,"compression:",compression)
+print("Size: JSON {:.1f} MB, container {:.1f} MB ({:.1f}x smaller)".format(json_size/2**20, container_size/2**20, json_size/container_size))
+print("Writing the container: {:.2f} s".format(write_time))
+for name, t in times.items():
+    print("Loading {:<25}{:>8.2f} s".format(name+":", t))
+print("Speedup of loading: dicts {:.1f}x, Text objects {:.1f}x".format(times["JSON, dicts"]/times["container, dicts"],
+                                                                      times["JSON, Text objects"]/times["container, Text objects"]))
+if differences:
+    print("Documents that differ:", ", ".join(differences))
+    raise SystemExit(1)
@@ -0,0 +1,51 @@
+# Benchmark of finding web language patterns (the vocabulary of paragraphweblanguagescoreretagger) in files from folder "kirjak_vs_mittekirjak_ettenten".
+# Compares EstNLTK's RegexTagger (used by earlier versions of the retagger) with WebLanguageScanner, and reports characters per second.
+
+import os
+import json
+import argparse
+from time import perf_counter
+from estnltk import Text
+from estnltk.taggers import RegexTagger
+from paragraphweblanguagescoreretagger import vocabulary, WebLanguageScanner
+
+
+arg_parser = argparse.ArgumentParser(description='Benchmark of finding web language patterns in texts.')
+arg_parser.add_argument('--in_dir', default='kirjak_vs_mittekirjak_ettenten', help='folder of json-files')
+arg_parser.add_argument('--repeats', type=int, default=3, help='how many times the corpus is scanned (the best time is reported)')
+args = arg_parser.parse_args()
+
+texts=[]
+for file in sorted(os.listdir(args.in_dir)):
+    if file.endswith(".json"):
+        with open(os.path.join(args.in_dir, file), 'r', encoding='utf-8') as f:
+            texts.append(json.load(f)["text"])
+chars=sum(len(t) for t in texts)
+print("Files:",len(texts),"characters:",chars,"\n")
+
+regex_tagger=RegexTagger(vocabulary=vocabulary, output_layer='web_language', output_attributes=['pattern_type'],
+                         conflict_resolving_strategy='ALL')
+separate_scanner=WebLanguageScanner(vocabulary)
+fused_scanner=WebLanguageScanner(vocabulary, fused=True)
+
+def regex_tagger_matches(t):
+    text=Text(t)
+    return sorted((span.start, span.end, span.pattern_type) for span in regex_tagger.make_layer(text=text))
+
+engines=[("RegexTagger", regex_tagger_matches),
+         ("WebLanguageScanner", lambda t: [tuple(m) for m in separate_scanner.scan(t)]),
+         ("WebLanguageScanner (fused)", lambda t: [tuple(m) for m in fused_scanner.scan(t)])]
+
+reference=None
+for name, engine in engines:
+    best=None
+    for i in range(args.repeats):
+        start=perf_counter()
+        matches=[engine(t) for t in texts]
+        elapsed=perf_counter()-start
+        best=elapsed if best is None else min(best, elapsed)
+    if reference is None:
+        reference=matches
+    print(name)
+    print("  matches:",sum(len(m) for m in matches),"(same as RegexTagger)" if matches==reference else "(DIFFERENT from RegexTagger)")
+    print("  time: {:.3f} s, {:.0f} chars/sec".format(best, chars/best))
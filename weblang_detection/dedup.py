@@ -0,0 +1,160 @@
+# Finding exact and near-duplicate documents before they are analysed.
+#
+# Exact duplicates have the same normalised text (lowercase, whitespace collapsed); they are found by the sha1 hash
+# of the normalised text. Near-duplicates are found with MinHash signatures of word shingles and LSH banding:
+# a signature is cut into bands, documents that have an equal band are candidates, and a candidate is a duplicate
+# if the Jaccard similarity of the shingles (estimated from the signatures) is at least the threshold.
+# Documents and signatures are kept in an SQLite index, so that the documents of a later crawl are also compared
+# with the documents of earlier runs.
+
+import json
+import sqlite3
+import hashlib
+import numpy as np
+
+
+# hashes of the shingles are 32-bit; permutations are (a*x + b) mod PRIME, where PRIME is the largest prime < 2**32,
+# so that the values of a signature fit into 32 bits (a*x + b fits into 64 bits when a, b and x are 32-bit)
+PRIME = 4294967291
+MAX_HASH = 2**32 - 1
+
+
+def normalise(text):
+    """Returns the text in lowercase, with words separated by single spaces."""
+    return ' '.join(text.lower().split())
+
+
+def shingle_hashes(normalised_text, shingle_size=5):
+    """Returns the 32-bit hashes of the word shingles (shingle_size consecutive words) of a normalised text.
+       A text shorter than shingle_size words is a single shingle."""
+    words=normalised_text.split(' ')
+    shingles={' '.join(words[i:i+shingle_size]) for i in range(max(len(words)-shingle_size+1, 1))}
+    digests=b''.join(hashlib.blake2b(shingle.encode('utf-8'), digest_size=4).digest() for shingle in shingles)
+    return np.frombuffer(digests, dtype=np.uint32).astype(np.uint64)
+
+
+def lsh_parameters(threshold, num_perm, recall=0.9):
+    """Returns (bands, rows) of the banding of signatures with num_perm values. Of the settings where documents
+       with the threshold similarity become candidates with probability at least recall, the one with most rows
+       (fewest false candidates) is chosen."""
+    settings=[(num_perm//rows, rows) for rows in range(1, num_perm+1) if num_perm % rows == 0]
+    good=[(bands, rows) for bands, rows in settings if 1-(1-threshold**rows)**bands >= recall]
+    return max(good, key=lambda setting: setting[1]) if good else settings[0]
+
+
+class MinHasher:
+    """Makes MinHash signatures (num_perm values) of the shingles of texts."""
+
+    def __init__(self, num_perm=128, shingle_size=5, seed=1):
+        self.num_perm=num_perm
+        self.shingle_size=shingle_size
+        generator=np.random.RandomState(seed)
+        self.a=generator.randint(1, PRIME, size=num_perm, dtype=np.uint64)
+        self.b=generator.randint(0, PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, normalised_text, chunk=10000):
+        hashes=shingle_hashes(normalised_text, self.shingle_size)
+        signature=np.full(self.num_perm, MAX_HASH, dtype=np.uint64)
+        # shingles are permuted in chunks, so that the matrix of shingles x permutations stays small
+        for start in range(0, len(hashes), chunk):
+            permuted=(np.outer(hashes[start:start+chunk], self.a) + self.b) % PRIME
+            signature=np.minimum(signature, permuted.min(axis=0))
+        return signature.astype(np.uint32)
+
+
+class DuplicateIndex:
+    """SQLite index of documents for finding exact and near-duplicates. add() checks a document against all
+       documents indexed before (in this run and earlier runs) and adds it to the index.
+       Settings of the signatures (num_perm, shingle_size, bands, prime) are stored in the index when it is made;
+       the threshold can be changed between runs."""
+
+    def __init__(self, path, threshold=0.8, num_perm=128, shingle_size=5, seed=1):
+        self.threshold=threshold
+        self.db=sqlite3.connect(path)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS documents (doc_id TEXT PRIMARY KEY, output TEXT, words INTEGER, text_hash TEXT,
+                                                  signature BLOB, canonical TEXT, duplicate TEXT, similarity REAL);
+            CREATE INDEX IF NOT EXISTS document_hashes ON documents (text_hash);
+            CREATE TABLE IF NOT EXISTS bands (band INTEGER, bucket BLOB, doc_id TEXT);
+            CREATE INDEX IF NOT EXISTS band_buckets ON bands (band, bucket);''')
+        row=self.db.execute("SELECT value FROM settings WHERE name='minhash'").fetchone()
+        if row is None:
+            bands, rows=lsh_parameters(threshold, num_perm)
+            settings={'num_perm': num_perm, 'shingle_size': shingle_size, 'seed': seed, 'bands': bands, 'rows': rows, 
+                      'prime': PRIME}
+            self.db.execute("INSERT INTO settings VALUES ('minhash', ?)", (json.dumps(settings),))
+        else:
+            settings=json.loads(row[0])
+            if settings.get('prime') != PRIME:
+                raise ValueError('(!) Signatures of the duplicate index {!r} were made with another prime; '.format(path)+
+                                 'make a new index.')
+        self.settings=settings
+        self.minhasher=MinHasher(settings['num_perm'], settings['shingle_size'], settings['seed'])
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def add(self, doc_id, text, output=None):
+        """Checks if the text is a duplicate of an indexed document and adds it to the index; output is the
+           location of the results of the document. Returns (duplicate, canonical, canonical_output, similarity):
+           duplicate is 'exact', 'near' or None (not a duplicate); canonical is the id of the document whose
+           results can be used instead. A document that is already in the index is not checked again."""
+        row=self.db.execute("SELECT duplicate, canonical, similarity FROM documents WHERE doc_id=?", (doc_id,)).fetchone()
+        if row is not None:
+            duplicate, canonical, similarity=row
+            if duplicate is None:
+                return None, None, None, None
+            return duplicate, canonical, self._output(canonical), similarity
+        normalised=normalise(text)
+        words=len(normalised.split())
+        text_hash=hashlib.sha1(normalised.encode('utf-8')).hexdigest()
+        duplicate=canonical=similarity=None
+        row=self.db.execute("SELECT doc_id, canonical FROM documents WHERE text_hash=? LIMIT 1", (text_hash,)).fetchone()
+        if row is not None:
+            # an exact copy of a near-duplicate gets the canonical document of the near-duplicate
+            duplicate, canonical, similarity='exact', row[1] or row[0], 1.0
+        else:
+            signature=self.minhasher.signature(normalised)
+            canonical, similarity=self._most_similar(signature)
+            if canonical is not None:
+                duplicate='near'
+        if duplicate is not None:
+            self.db.execute("INSERT INTO documents VALUES (?, ?, ?, ?, NULL, ?, ?, ?)",
+                            (doc_id, output, words, text_hash, canonical, duplicate, similarity))
+            return duplicate, canonical, self._output(canonical), similarity
+        # only documents that are not duplicates are compared with the next documents
+        self.db.execute("INSERT INTO documents VALUES (?, ?, ?, ?, ?, NULL, NULL, NULL)",
+                        (doc_id, output, words, text_hash, signature.tobytes()))
+        rows=self.settings['rows']
+        self.db.executemany("INSERT INTO bands VALUES (?, ?, ?)",
+                            [(band, signature[band*rows:(band+1)*rows].tobytes(), doc_id) for band in range(self.settings['bands'])])
+        return None, None, None, None
+
+    def _most_similar(self, signature):
+        # candidates have an equal band; the one with the highest estimated similarity over the threshold is returned
+        rows=self.settings['rows']
+        candidates=set()
+        for band in range(self.settings['bands']):
+            bucket=signature[band*rows:(band+1)*rows].tobytes()
+            candidates.update(doc_id for doc_id, in self.db.execute("SELECT doc_id FROM bands WHERE band=? AND bucket=?", (band, bucket)))
+        best, best_similarity=None, None
+        for doc_id in sorted(candidates):
+            candidate=np.frombuffer(self.db.execute("SELECT signature FROM documents WHERE doc_id=?", (doc_id,)).fetchone()[0], dtype=np.uint32)
+            similarity=float(np.mean(candidate == signature))
+            if similarity >= self.threshold and (best is None or similarity > best_similarity):
+                best, best_similarity=doc_id, similarity
+        return best, best_similarity
+
+    def _output(self, doc_id):
+        return self.db.execute("SELECT output FROM documents WHERE doc_id=?", (doc_id,)).fetchone()[0]
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,39 @@
+# Packs json-files of a folder into a packed corpus (see packed_corpus.py): a few large shard files with offset indexes.
+# A packed corpus can be given to process_and_save_results.py and to the scoring scripts instead of a folder of files.
+
+import os
+import argparse
+from time import perf_counter
+from packed_corpus import PackedCorpusWriter
+
+
+arg_parser = argparse.ArgumentParser(description='Packs json-files of a folder into a packed corpus.')
+arg_parser.add_argument('in_dir', help='folder of json-files')
+arg_parser.add_argument('out_dir', help='folder of the packed corpus (shards of earlier runs are kept)')
+arg_parser.add_argument('--in_files', default=None, help='a text file containing names of the files that should be packed')
+arg_parser.add_argument('--prefix', default='pack', help='prefix of the names of the shards')
+arg_parser.add_argument('--shard_mb', type=int, default=1024, help='size of a shard in megabytes')
+arg_parser.add_argument('--compression', default='none', choices=['none', 'gzip', 'zstd'],
+                        help='compression of the documents (documents that are not compressed are read without copying)')
+args = arg_parser.parse_args()
+
+os.makedirs(args.out_dir, exist_ok=True)
+if args.in_files:
+    with open(args.in_files, 'r', encoding='utf-8') as f:
+        files=[line.strip() for line in f if line.strip()]
+else:
+    files=sorted(f for f in os.listdir(args.in_dir) if f.endswith('.json'))
+
+start=perf_counter()
+in_size=0
+with PackedCorpusWriter(args.out_dir, prefix=args.prefix, shard_bytes=args.shard_mb*2**20, compression=args.compression) as writer:
+    for i, file in enumerate(files):
+        with open(os.path.join(args.in_dir, file), 'rb') as f:
+            data=f.read()
+        in_size+=len(data)
+        writer.add(file, data)
+        if (i+1) % 10000 == 0:
+            print(i+1,'files packed')
+
+out_size=sum(os.path.getsize(os.path.join(args.out_dir, f)) for f in os.listdir(args.out_dir) if f.startswith(args.prefix+'_'))
+print("Packed",len(files),"files ({:.1f} MB) into {} ({:.1f} MB) in {:.1f} s".format(in_size/2**20, args.out_dir, out_size/2**20, perf_counter()-start))
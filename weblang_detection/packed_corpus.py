@@ -0,0 +1,164 @@
+# Packed input corpus: many JSON documents in a few large files instead of one file per document.
+#
+# A packed corpus is a folder of shards (made by pack_corpus.py):
+#   <prefix>_00000.pack        -- documents one after another; every document is compressed separately
+#                                 (gzip or zstd, see pack_corpus.py --compression) or not compressed (default);
+#   <prefix>_00000.pack.index  -- JSON: compression of the shard and [doc_id, offset, length] of every document;
+#   packed_corpus.json         -- list of the shards and numbers of their documents.
+# Shards are read through mmap, so reading a document does not open a file; documents that are not compressed
+# are sliced from the mapped file without copying.
+
+import os
+import json
+import mmap
+from text_container import compressor
+
+
+SUMMARY_FILE = 'packed_corpus.json'
+
+
+def is_packed_corpus(path):
+    """Returns True if the folder is a packed corpus (checks only one file, not the contents of the folder)."""
+    return os.path.isfile(os.path.join(path, SUMMARY_FILE))
+
+
+class PackedCorpusWriter:
+    """Writes documents (bytes) into shards of a packed corpus.
+       A shard is closed (and its index written) when it is larger than shard_bytes."""
+
+    def __init__(self, out_dir, prefix='pack', shard_bytes=2**30, compression='none'):
+        self.out_dir=out_dir
+        self.prefix=prefix
+        self.shard_bytes=shard_bytes
+        self.compression=compression
+        self.compress=compressor(compression)[0]
+        self.shard_number=0
+        while os.path.exists(self._shard_path(self.shard_number)+'.index'):
+            self.shard_number+=1
+        self.shard=None
+
+    def _shard_path(self, number):
+        return os.path.join(self.out_dir, '{}_{:05d}.pack'.format(self.prefix, number))
+
+    def add(self, doc_id, data):
+        if self.shard is None:
+            self.shard=open(self._shard_path(self.shard_number), 'wb')
+            self.documents=[]
+        data=self.compress(data)
+        self.documents.append([doc_id, self.shard.tell(), len(data)])
+        self.shard.write(data)
+        if self.shard.tell() >= self.shard_bytes:
+            self.close_shard()
+
+    def close_shard(self):
+        if self.shard is None:
+            return
+        self.shard.close()
+        self.shard=None
+        index_path=self._shard_path(self.shard_number)+'.index'
+        with open(index_path+'.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'compression': self.compression, 'documents': self.documents}, f, ensure_ascii=False)
+        os.replace(index_path+'.tmp', index_path)
+        self.shard_number+=1
+
+    def close(self):
+        """Closes the last shard and writes the summary of all shards of the folder."""
+        self.close_shard()
+        shards={}
+        for file in sorted(os.listdir(self.out_dir)):
+            if file.endswith('.pack.index'):
+                with open(os.path.join(self.out_dir, file), 'r', encoding='utf-8') as f:
+                    shards[file[:-len('.index')]]=len(json.load(f)['documents'])
+        with open(os.path.join(self.out_dir, SUMMARY_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'documents': sum(shards.values()), 'shards': shards}, f, indent=1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PackedCorpus:
+    """Reads documents from a packed corpus. Indexes of the shards are loaded at first; a shard is mapped
+       into memory when a document of it is read for the first time."""
+
+    def __init__(self, in_dir):
+        self.in_dir=in_dir
+        with open(os.path.join(in_dir, SUMMARY_FILE), 'r', encoding='utf-8') as f:
+            summary=json.load(f)
+        self.shards=[]
+        self.locations={}
+        for shard_file in summary['shards']:
+            with open(os.path.join(in_dir, shard_file+'.index'), 'r', encoding='utf-8') as f:
+                index=json.load(f)
+            shard=len(self.shards)
+            self.shards.append({'path': os.path.join(in_dir, shard_file), 'compression': index['compression'],
+                                'decompress': compressor(index['compression'])[1], 'map': None})
+            for doc_id, offset, length in index['documents']:
+                self.locations[doc_id]=(shard, offset, length)
+
+    def __len__(self):
+        return len(self.locations)
+
+    def __contains__(self, doc_id):
+        return doc_id in self.locations
+
+    def doc_ids(self):
+        return list(self.locations)
+
+    def size(self, doc_id):
+        """Returns the size of the document in the shard (bytes)."""
+        return self.locations[doc_id][2]
+
+    def raw(self, doc_id):
+        """Returns the document as bytes; a document that is not compressed is returned as a memoryview
+           of the mapped shard (without copying)."""
+        shard_number, offset, length=self.locations[doc_id]
+        shard=self.shards[shard_number]
+        if shard['map'] is None:
+            with open(shard['path'], 'rb') as f:
+                shard['map']=mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        data=memoryview(shard['map'])[offset:offset+length]
+        if shard['compression'] == 'none':
+            return data
+        return shard['decompress'](data)
+
+    def text(self, doc_id):
+        """Returns the document as a string."""
+        return str(self.raw(doc_id), 'utf-8')
+
+    def close(self):
+        for shard in self.shards:
+            if shard['map'] is not None:
+                shard['map'].close()
+                shard['map']=None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_documents(path, ext='.json'):
+    """Yields (name, contents) of the files with extension ext of a folder (sorted by name),
+       or of the documents of a packed corpus."""
+    if is_packed_corpus(path):
+        with PackedCorpus(path) as corpus:
+            for doc_id in corpus.doc_ids():
+                yield doc_id, corpus.text(doc_id)
+    else:
+        for file in sorted(os.listdir(path)):
+            if file.endswith(ext):
+                with open(os.path.join(path, file), 'r', encoding='utf-8') as f:
+                    yield file, f.read()
+
+
+def document_sizes(path, names):
+    """Returns a dict of the sizes (bytes) of the documents of a folder or a packed corpus.
+       Sizes are cheap estimates of the time of processing the documents."""
+    if is_packed_corpus(path):
+        with PackedCorpus(path) as corpus:
+            return {name: corpus.size(name) for name in names}
+    return {name: os.path.getsize(os.path.join(path, name)) for name in names}
@@ -0,0 +1,116 @@
+# Cache of the web language features of paragraphs.
+#
+# Pages of a domain share many paragraphs (navigation, footers, disclaimers). ParagraphWebLanguageScoreRetagger
+# with cache=ParagraphCache() looks up the counts of every paragraph by the hash of its text, the settings of
+# the retagger and the compound tokens of the whole text that unknown words are counted by, and counts unknown words and missing commas (Vabamorf and the ClauseSegmenter) only in paragraphs
+# that are not in the cache. Only these two counts are kept: matches of the web language patterns can depend on the
+# text around a paragraph (a match may start in the separator before it or run into the next paragraph), so
+# the other features are counted in the whole text, which is cheap. The cache keeps the most recently used paragraphs in memory (LRU); if a path is given,
+# paragraphs are also kept in an SQLite file, so that they can be used in later runs.
+# Hits and misses are counted per domain; the domain is the middle part of file names like
+# "kirjak__valitsus_ee__106660.json".
+
+import json
+import sqlite3
+import hashlib
+from collections import OrderedDict
+
+
+def domain_of(file_name):
+    """Returns the domain of a file name like "kirjak__valitsus_ee__106660.json" ("valitsus_ee"), or None."""
+    parts=file_name.split('__')
+    return parts[1] if len(parts) == 3 else None
+
+
+def paragraph_key(paragraph_text, configuration):
+    """Returns the key of a paragraph: sha1 hash of the configuration of the retagger and the text of the paragraph.
+       Only surrounding whitespace is removed from the text, because features depend on the case and spacing of the text."""
+    return hashlib.sha1((configuration+'\n'+paragraph_text.strip()).encode('utf-8')).hexdigest()
+
+
+class HitStatistics:
+    """Hits and misses of paragraphs in the cache by domains."""
+
+    def __init__(self):
+        self.domains={}
+
+    def count(self, domain, hits, misses):
+        """Adds hits and misses of paragraphs to the statistics of the domain."""
+        statistics=self.domains.setdefault(domain, {'hits': 0, 'misses': 0})
+        statistics['hits']+=hits
+        statistics['misses']+=misses
+
+    def hit_rates(self):
+        """Returns {domain: {'hits': ..., 'misses': ..., 'hit_rate': ...}}, domains with most paragraphs first."""
+        rates={}
+        for domain, v in sorted(self.domains.items(), key=lambda item: -(item[1]['hits']+item[1]['misses'])):
+            total=v['hits']+v['misses']
+            rates[domain]=dict(v, hit_rate=v['hits']/total if total else 0.0)
+        return rates
+
+    def report(self, limit=None):
+        """Returns a table of the hit rates of the domains (the limit domains with most paragraphs) and of all domains."""
+        lines=['{:<32}{:>12}{:>12}{:>10}'.format('domain', 'paragraphs', 'hits', 'hit rate')]
+        rates=self.hit_rates()
+        for domain, v in list(rates.items())[:limit]:
+            lines.append('{:<32}{:>12}{:>12}{:>10.1%}'.format(str(domain), v['hits']+v['misses'], v['hits'], v['hit_rate']))
+        hits=sum(v['hits'] for v in rates.values())
+        total=sum(v['hits']+v['misses'] for v in rates.values())
+        lines.append('{:<32}{:>12}{:>12}{:>10.1%}'.format('(all)', total, hits, hits/total if total else 0.0))
+        return '\n'.join(lines)
+
+
+class ParagraphCache:
+    """Counts of the attributes of paragraphs (lists in the order of output_attributes of the retagger) by their keys.
+       At most max_size paragraphs are kept in memory (least recently used are removed first); if path is given,
+       all paragraphs are also written into an SQLite file, where paragraphs that are not in memory are looked up.
+       The SQLite file can be shared by worker processes (every insert is committed at once, without syncing to disk)."""
+
+    def __init__(self, max_size=100000, path=None):
+        self.max_size=max_size
+        self.memory=OrderedDict()
+        self.db=None
+        if path is not None:
+            self.db=sqlite3.connect(path, timeout=60, isolation_level=None)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=OFF")
+            self.db.execute("CREATE TABLE IF NOT EXISTS paragraphs (key TEXT PRIMARY KEY, counts TEXT)")
+        self.statistics=HitStatistics()
+
+    def __len__(self):
+        return len(self.memory)
+
+    def get(self, key):
+        """Returns the counts of the paragraph, or None if the paragraph is not in the cache."""
+        counts=self.memory.get(key)
+        if counts is not None:
+            self.memory.move_to_end(key)
+            return counts
+        if self.db is not None:
+            row=self.db.execute("SELECT counts FROM paragraphs WHERE key=?", (key,)).fetchone()
+            if row is not None:
+                counts=json.loads(row[0])
+                self._remember(key, counts)
+        return counts
+
+    def put(self, key, counts):
+        self._remember(key, counts)
+        if self.db is not None:
+            self.db.execute("INSERT OR REPLACE INTO paragraphs VALUES (?, ?)", (key, json.dumps(counts)))
+
+    def _remember(self, key, counts):
+        self.memory[key]=counts
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db=None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,11 +1,14 @@
 from estnltk.taggers import Retagger
-from estnltk.taggers import RegexTagger
-import estnltk.taggers.dict_taggers.vocabulary 
 from estnltk.taggers import VabamorfTagger
 from estnltk.taggers import ClauseSegmenter
+import json
+import threading
 import regex as re
+import re as stdlib_re
+from collections import namedtuple
 from collections import defaultdict
-from estnltk.layer.span_operations import conflict
+from bisect import bisect_left, bisect_right
+from time import perf_counter
 
 
 MACROS={'LOWERCASE': 'a-zšžõäöü','UPPERCASE': 'A-ZŠŽÕÄÖÜ','NUMERIC': '0-9','2,':'{2,}','1,':'{1,}','4,':'{4,}','0,1':'{0,1}','1,2':'{1,2}'}
@@ -46,18 +49,376 @@ vocabulary = [
 
 
 
+# key of text.meta where process_and_save_results.py records settings of the morph_analysis layer
+MORPH_ANALYSIS_SETTINGS_META = 'morph_analysis_settings'
+
+WebLanguageMatch = namedtuple('WebLanguageMatch', ['start', 'end', 'pattern_type'])
+
+# numbered backreferences in the source of a pattern (e.g. \1), except escaped backslashes
+BACKREFERENCE = re.compile(r'''(?<!\\)((?:\\\\)*)\\([1-9][0-9]*)''')
+
+
+class WebLanguageScanner:
+    """Finds matches of all the patterns of a vocabulary in a text. 
+       Gives the same matches as RegexTagger with conflict_resolving_strategy='ALL': every pattern 
+       finds its own non-overlapping matches, but matches of different patterns may overlap.
+       
+       If fused=True, the patterns are merged into one pattern of named lookaheads and the text is 
+       scanned only once; otherwise every pattern scans the text separately."""
+    
+    def __init__(self, vocabulary, fused=False):
+        self.vocabulary=vocabulary
+        self.fused=fused
+        # patterns are recompiled with the standard library re, which is faster on these patterns than regex
+        self.patterns=[stdlib_re.compile(voc['_regex_pattern_'].pattern, self._flags(voc['_regex_pattern_'])) 
+                       for voc in vocabulary]
+        self.groups=[voc.get('_group_', 0) for voc in vocabulary]
+        self.pattern_types=[voc['pattern_type'] for voc in vocabulary]
+        if fused and vocabulary:
+            self.fused_pattern, self.fused_groups=self._fuse()
+    
+    @staticmethod
+    def _flags(pattern):
+        flags=0
+        for flag, stdlib_flag in ((re.X, stdlib_re.X), (re.I, stdlib_re.I), (re.M, stdlib_re.M), (re.S, stdlib_re.S)):
+            if pattern.flags & flag:
+                flags|=stdlib_flag
+        return flags
+    
+    def _fuse(self):
+        # every pattern k is placed into a lookahead (?=(?P<pk>...)|), so all patterns are tried at 
+        # every position of the text; the final conditional fails if none of the patterns matched
+        lookaheads=[]
+        fused_groups=[]
+        group_number=1
+        for k, pattern in enumerate(self.patterns):
+            if any(pattern.flags & flag != self.patterns[0].flags & flag for flag in (stdlib_re.X, stdlib_re.I, stdlib_re.M, stdlib_re.S)):
+                raise ValueError('(!) Patterns with different flags cannot be fused: {!r}'.format(pattern.pattern))
+            # backreferences are renumbered, because groups of previous patterns come first
+            source=BACKREFERENCE.sub(lambda m: m.group(1)+'(?:\\{})'.format(group_number+int(m.group(2))), pattern.pattern)
+            # newline ends a possible comment of a verbose pattern
+            if pattern.flags & stdlib_re.X:
+                source+='\n'
+            lookaheads.append('(?=(?P<p{}>{})|)'.format(k, source))
+            fused_groups.append(group_number+self.groups[k])
+            group_number+=1+pattern.groups
+        condition='(?!)'
+        for k in reversed(range(len(self.patterns))):
+            condition='(?(p{}){})'.format(k, '|'+condition)
+        return stdlib_re.compile(''.join(lookaheads)+condition, self.patterns[0].flags), fused_groups
+    
+    def scan(self, text):
+        """Returns a list of WebLanguageMatch-es sorted by their position."""
+        if not self.patterns:
+            return []
+        if self.fused:
+            matches=self._scan_fused(text)
+        else:
+            matches=self._scan_separately(text)
+        matches.sort()
+        return matches
+    
+    def _scan_separately(self, text):
+        matches=[]
+        for pattern, group, pattern_type in zip(self.patterns, self.groups, self.pattern_types):
+            for m in pattern.finditer(text):
+                start, end=m.span(group)
+                if start != end:
+                    matches.append(WebLanguageMatch(start, end, pattern_type))
+        return matches
+    
+    def _scan_fused(self, text):
+        matches=[]
+        # like finditer, a pattern continues searching from the end of its previous match
+        next_start=[0]*len(self.patterns)
+        for m in self.fused_pattern.finditer(text):
+            for k, group in enumerate(self.fused_groups):
+                match_start, match_end=m.span('p{}'.format(k))
+                if match_start < 0 or match_start < next_start[k]:
+                    continue
+                next_start[k]=max(match_end, match_start+1) # patterns of the vocabulary do not match empty strings
+                start, end=m.span(group)
+                if start != end:
+                    matches.append(WebLanguageMatch(start, end, self.pattern_types[k]))
+        return matches
+
+
+
+class ParagraphSpanIndex:
+    """Sorted start and end positions of the paragraphs of a text. 
+       Is built once per text and finds the paragraph that contains a span by binary search."""
+    
+    def __init__(self, paragraphs):
+        self.starts=[parag.start for parag in paragraphs]
+        self.ends=[parag.end for parag in paragraphs]
+        
+    def __len__(self):
+        return len(self.starts)
+    
+    def locate(self, span):
+        """Returns the index of the paragraph that contains the span, or None if the span is not inside of a paragraph."""
+        # paragraphs do not overlap, so only the last paragraph starting before the span can contain it
+        i=bisect_right(self.starts, span.start) - 1
+        if i >= 0 and span.end <= self.ends[i]:
+            return i
+        return None
+    
+    def window(self, first, last):
+        """Returns the index of paragraphs first...last-1 (paragraphs are numbered from 0 in the new index)."""
+        window_index=ParagraphSpanIndex([])
+        window_index.starts=self.starts[first:last]
+        window_index.ends=self.ends[first:last]
+        return window_index
+
+
+
+def paragraph_windows(paragraphs, window_size=None):
+    """Yields (first, last) of windows of consecutive paragraphs first...last-1 that cover the paragraphs (sorted numbers). 
+       A window has at most window_size paragraphs (any number if window_size is None)."""
+    first=last=None
+    for i in paragraphs:
+        if first is not None and (i != last or (window_size is not None and last-first >= window_size)):
+            yield first, last
+            first=None
+        if first is None:
+            first=i
+        last=i+1
+    if first is not None:
+        yield first, last
+
+
+
+class LayerWindows:
+    """Cuts layers of a text into windows (e.g. a few paragraphs at a time). 
+       Start positions of the spans of every layer are collected once per text and windows are found by binary search."""
+    
+    def __init__(self, layers):
+        self.layers=layers
+        self.starts={name: [span.start for span in layer] for name, layer in layers.items()}
+    
+    def window(self, start, end):
+        """Returns layers that only contain the spans starting between start and end."""
+        return {name: layer[bisect_left(self.starts[name], start):bisect_left(self.starts[name], end)] 
+                for name, layer in self.layers.items()}
+
+
+
+class ExcludedSpanIndex:
+    """Merged positions of compound tokens whose web language matches are not counted. 
+       Is built once per text and checks if a match overlaps an excluded compound token by binary search."""
+    
+    def __init__(self, compound_tokens, excluded_types=None):
+        # excluded_types=None excludes every compound token
+        intervals=sorted((item.start, item.end) for cp in compound_tokens 
+                         if excluded_types is None or any(t in excluded_types for t in cp.type) 
+                         for item in cp)
+        self.starts=[]
+        self.ends=[]
+        for start, end in intervals: # overlapping and touching tokens are merged into one interval
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1]=max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+    
+    def overlaps(self, span):
+        """Returns True if the span has at least one common position with an excluded compound token."""
+        # intervals are disjoint, so the last interval starting before the end of the span reaches furthest
+        i=bisect_left(self.starts, span.end) - 1
+        return i >= 0 and self.ends[i] > span.start
+
+
+
+# clauses ending with these words are followed by a clause that is not counted as a missing comma
+NOT_SUITABLE_CLAUSE_ENDINGS={"ainult","vaevalt","peaasi","mitte","ilma","olgugi","nii","sellepärast","selleks","et","sest","aga","kuid","vaid","siis","ja","ning","ega","ehk","või","palun"}
+# clauses ending with these words are followed by a clause that is not counted as a missing comma if the clause starts with "kui"
+NOT_SUITABLE_BEFORE_KUI={"juhul","enne","isegi","siis"}
+
+
+class ClauseBoundaryIndex:
+    """Start and end positions of clauses and ignore_missing_commas clauses of a text. 
+       Is built once per text and counts clauses with a missing comma that start at a word by direct lookups."""
+    
+    def __init__(self, clauses, ignore_missing_commas_clauses):
+        self.clause_starts={c.start for c in clauses if c} # indexes of the beginnings of clauses
+        self.ignore_clause_first_words=defaultdict(list) # beginnings of clauses (also clauses that have a missing comma) and their first words
+        self.ignore_clause_last_words=defaultdict(list) # ends of clauses and their last words
+        for cl in ignore_missing_commas_clauses:
+            self.ignore_clause_first_words[cl.start].append(cl.text[0].lower())
+            self.ignore_clause_last_words[cl.end].append(cl.text[-1].lower())
+    
+    def not_suitable(self, word):
+        """Checks for clauses that shouldn't be counted as attributes: 
+           clauses that start at the word when the previous clause ends eg with a word "ainult", 
+           or the previous clause ends eg with a word "juhul" and the clause starts with "kui"."""
+        previous_last_words=self.ignore_clause_last_words.get(word.start-1, ())
+        if any(w in NOT_SUITABLE_CLAUSE_ENDINGS for w in previous_last_words):
+            return True
+        if any(w in NOT_SUITABLE_BEFORE_KUI for w in previous_last_words):
+            return "kui" in self.ignore_clause_first_words.get(word.start, ())
+        return False
+    
+    def missing_commas(self, word):
+        """Returns the number of clauses with a missing comma that start at the word."""
+        # if the start index of a clause is only in ignore_missing_commas_clauses, it means there is a missing comma
+        if word.start in self.clause_starts or word.start not in self.ignore_clause_first_words:
+            return 0
+        if self.not_suitable(word) or word.text == "palun":
+            return 0
+        return len(self.ignore_clause_first_words[word.start])
+
+
+
+# name of the temporary layer of morphological analysis used for finding unknown words
+UNKNOWN_WORDS_LAYER = 'morph_unknown_words'
+# name of the temporary clauses layer (without missing commas) used for finding missing commas
+MISSING_COMMAS_CLAUSES_LAYER = 'ignore_missing_commas_clauses'
+
+
+def _process_lines(java_process, lines):
+    """Sends all lines to the Java process at once and reads back one result line per input line.
+       Lines are written by a separate thread, so that neither side blocks on a full pipe."""
+    if java_process._process is None:
+        java_process.initialize_java_subprocess()
+    process=java_process._process
+    
+    def write_lines():
+        try:
+            for line in lines:
+                process.stdin.write(line.encode('utf-8') + b'\n')
+            process.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            pass # the reader reports the error
+    
+    writer=threading.Thread(target=write_lines, daemon=True)
+    writer.start()
+    results=[]
+    for i in range(len(lines)):
+        result=process.stdout.readline().decode('utf-8')
+        if result == '':
+            process.terminate()
+            stderr=process.stderr.read().decode('utf-8') if process.stderr else ''
+            # the process is started again on the next call
+            java_process._process=None
+            raise Exception('EOF encountered while reading stream. Stderr is {0}.'.format(stderr))
+        results.append(result)
+    writer.join()
+    return results
+
+
+def segment_clauses_in_batch(clause_segmenter, texts):
+    """Tags clauses of many texts with one ClauseSegmenter and returns a layer for every text. 
+       ClauseSegmenter.make_layer makes a request to the Java process and waits for the answer for every sentence; 
+       here sentences of all the texts are sent to the Java process at once, and the answers are split back per text. 
+       The layers are the same as the ones made by ClauseSegmenter.make_layer."""
+    try:
+        from estnltk.taggers.morph_analysis.morf_common import _convert_morph_analysis_span_to_vm_dict
+        from estnltk.taggers.morph_analysis.morf_common import _is_empty_annotation, _get_word_text
+        java_process=clause_segmenter._java_process
+        for name in ('_make_layer_template', '_input_words_layer', '_input_morph_analysis_layer', 
+                     '_input_sentences_layer', 'annotate_clause_indices', 'use_normalized_word_form'):
+            getattr(clause_segmenter, name)
+        for name in ('_process', 'initialize_java_subprocess'):
+            getattr(java_process, name)
+    except (ImportError, AttributeError):
+        # this version of EstNLTK does not have the parts of ClauseSegmenter used here, texts are tagged one by one
+        return [clause_segmenter.make_layer(text=text) for text in texts]
+    
+    sentences=[] # index of the text, word spans and input line of every sentence
+    for text_i, text in enumerate(texts):
+        word_layer=text[clause_segmenter._input_words_layer]
+        morph_layer=text[clause_segmenter._input_morph_analysis_layer]
+        word_span_id=0
+        # words and morph analyses of a sentence are collected the same way as in ClauseSegmenter
+        for sentence in text[clause_segmenter._input_sentences_layer]:
+            sentence_morph_dicts=[]
+            sentence_words=[]
+            while word_span_id < len(word_layer):
+                word_span=word_layer[word_span_id]
+                if sentence.start <= word_span.start and word_span.end <= sentence.end:
+                    morph_span=morph_layer[word_span_id] if word_span_id < len(morph_layer) else None
+                    if morph_span is not None and word_span.base_span == morph_span.base_span and \
+                       len(morph_span.annotations) > 0 and not _is_empty_annotation(morph_span.annotations[0]):
+                        word_morph_dict=_convert_morph_analysis_span_to_vm_dict(morph_span)
+                    else:
+                        word_morph_dict={'text': word_span.text, 'analysis': []}
+                    if clause_segmenter.use_normalized_word_form:
+                        word_morph_dict['text']=_get_word_text(word_span)
+                    sentence_morph_dicts.append(word_morph_dict)
+                    sentence_words.append(word_span)
+                if sentence.end <= word_span.start:
+                    break
+                word_span_id+=1
+            if sentence_morph_dicts:
+                sentences.append((text_i, sentence_words, json.dumps({'words': sentence_morph_dicts})))
+    
+    results=_process_lines(java_process, [line for text_i, sentence_words, line in sentences])
+    
+    layers=[]
+    for text in texts:
+        layer=clause_segmenter._make_layer_template()
+        layer.text_object=text
+        layers.append(layer)
+    for (text_i, sentence_words, line), result in zip(sentences, results):
+        result_words=json.loads(result)['words']
+        assert len(result_words) == len(sentence_words), \
+               "(!) Unexpected mismatch between ClauseSegmenter's input and output."
+        clause_index=defaultdict(list) # words of every clause
+        clause_type_index={}
+        for word_id, word in enumerate(clause_segmenter.annotate_clause_indices(result_words)):
+            clause_index[word['clause_id']].append(sentence_words[word_id])
+            clause_type_index[word['clause_id']]=word['clause_type']
+        for clause_id, clause in clause_index.items():
+            layers[text_i].add_annotation(clause, clause_type=clause_type_index[clause_id])
+    return layers
+
+
+
+class ParagraphFeatures:
+    """Web language features of the paragraphs of a text as arrays (see ParagraphWebLanguageScoreRetagger.paragraph_features). 
+       matrix has a row for every paragraph and a column for every attribute (in the order of attributes); 
+       attributes that were not counted (in cascade mode or early-stop mode) are NaN. 
+       offsets has the start and the end position of every paragraph."""
+    
+    def __init__(self, attributes, attr_counts, paragraph_index, meta):
+        # numpy is only imported when features are returned as arrays, not when the retagger is imported
+        import numpy as np
+        self.attributes=tuple(attributes)
+        self.matrix=np.array([attr_counts[k] for k in self.attributes], dtype=float).T.reshape(len(paragraph_index), len(self.attributes))
+        self.offsets=np.array([paragraph_index.starts, paragraph_index.ends], dtype=int).T.reshape(len(paragraph_index), 2)
+        self.meta=meta
+    
+    @property
+    def whole_text_score(self):
+        return self.meta['whole_text_score']
+    
+    def column(self, attribute):
+        """Returns the counts of an attribute in every paragraph."""
+        return self.matrix[:, self.attributes.index(attribute)]
+    
+    def totals(self):
+        """Returns the total counts of the attributes in the whole text (NaN-s are left out)."""
+        import numpy as np
+        return np.nansum(self.matrix, axis=0)
+
+
+
 class ParagraphWebLanguageScoreRetagger(Retagger):
     """Retagger for detecting web language features in text. Web language features will be marked as attributes of the paragraphs layer."""
     
     conf_param = ['use_unknown_words','use_emoticons','use_letter_reps','use_punct_reps','use_capital_letters',
                   'use_missing_commas','use_ignored_capital','use_no_spaces','use_incorrect_spaces','use_foreign_letters',
-                  'regex_tagger']
+                  'excluded_compound_tokens','morph_analysis_layer','web_language_scanner',
+                  'cascade_threshold','cascade_band','cascade_statistics','expensive_detectors',
+                  'early_stop_threshold','early_stop_window','early_stop_z','early_stop_min_words',
+                  'instrument','instrument_meta','detector_statistics','chunk_size','cache','cache_configuration','_taggers']
     
     def __init__(self,
                  paragraphs_layer='paragraphs', 
                  words_layer='words', 
                  clauses_layer='clauses', 
                  compound_tokens_layer='compound_tokens',
+                 morph_analysis_layer='morph_analysis',
                  use_unknown_words=True,
                  use_emoticons=True,
                  use_letter_reps=True,
@@ -67,7 +428,18 @@ class ParagraphWebLanguageScoreRetagger(Retagger):
                  use_ignored_capital=True,
                  use_no_spaces=True,
                  use_incorrect_spaces=True,
-                 use_foreign_letters=True):  
+                 use_foreign_letters=True,
+                 excluded_compound_tokens=None,
+                 cascade_threshold=None,
+                 cascade_band=0.04,
+                 early_stop_threshold=None,
+                 early_stop_window=5,
+                 early_stop_z=None,
+                 early_stop_min_words=200,
+                 instrument=False,
+                 instrument_meta=False,
+                 chunk_size=None,
+                 cache=None):  
         
         output_attributes=('word_count',)
         
@@ -81,6 +453,45 @@ class ParagraphWebLanguageScoreRetagger(Retagger):
         self.use_no_spaces = use_no_spaces
         self.use_incorrect_spaces = use_incorrect_spaces
         self.use_foreign_letters = use_foreign_letters
+        # types of compound tokens (e.g. "www_address", "email") inside of which web language matches are not counted;
+        # None -- matches inside of all compound tokens are not counted (as in earlier versions of the retagger)
+        self.excluded_compound_tokens = None if excluded_compound_tokens is None else tuple(excluded_compound_tokens)
+        
+        # cascade mode: if cascade_threshold is set, unknown words and missing commas are only counted 
+        # if the score of the other attributes is in the uncertainty band (cascade_threshold - cascade_band, cascade_threshold]
+        self.cascade_threshold = cascade_threshold
+        self.cascade_band = cascade_band
+        # how many texts were retagged in cascade mode and how many of them skipped each expensive detector
+        self.cascade_statistics = {'texts': 0, 'skipped_unknown_words': 0, 'skipped_missing_commas': 0}
+        
+        # early-stop mode: if early_stop_threshold is set, unknown words and missing commas are counted 
+        # early_stop_window paragraphs at a time, until the label of the text can not change (see _early_stop_decided)
+        if cascade_threshold is not None and early_stop_threshold is not None:
+            raise ValueError('(!) cascade mode and early-stop mode can not be used together.')
+        self.early_stop_threshold = early_stop_threshold
+        self.early_stop_window = early_stop_window
+        self.early_stop_z = early_stop_z
+        self.early_stop_min_words = early_stop_min_words
+        
+        # chunked mode: if chunk_size is set, temporary layers for counting unknown words and missing commas are made 
+        # for chunk_size paragraphs at a time (also the size of the windows in early-stop mode)
+        self.chunk_size = chunk_size
+        
+        # paragraph cache: if cache is set (see paragraph_cache.ParagraphCache), counts of paragraphs that are in the cache 
+        # are taken from there, and only the other paragraphs are counted (see _count_features_with_cache)
+        if cache is not None and (cascade_threshold is not None or early_stop_threshold is not None):
+            raise ValueError('(!) paragraph cache can not be used in cascade mode or early-stop mode.')
+        self.cache = cache
+        
+        # instrumentation: if instrument is True, wall time, the number of counted spans and the number of calls of 
+        # every detector are collected into detector_statistics (see detector_report); 
+        # if instrument_meta is also True, statistics of every text are added to text.meta['detector_statistics']
+        self.instrument = instrument
+        self.instrument_meta = instrument_meta
+        self.detector_statistics = {}
+        
+        # existing morph layer that is used for finding unknown words if it was made with settings in MORPH_ANALYSIS_SETTINGS_META
+        self.morph_analysis_layer = morph_analysis_layer
         
         self.input_layers = [paragraphs_layer, words_layer, compound_tokens_layer, clauses_layer]
         self.output_layer = paragraphs_layer
@@ -109,53 +520,454 @@ class ParagraphWebLanguageScoreRetagger(Retagger):
         else:
             output_attributes          
         self.output_attributes=output_attributes
+        # Vabamorf is faster than the Java-based ClauseSegmenter, so unknown words are counted first
+        self.expensive_detectors=tuple(i for i in ("unknown_words", "missing_commas") if i in output_attributes)
+        # settings that change the counts of a paragraph are a part of the keys of the paragraph cache
+        # (only the counts of the expensive detectors are kept in the cache, see _count_features_with_cache)
+        self.cache_configuration=json.dumps({'attributes': output_attributes, 'cached_attributes': self.expensive_detectors, 
+                                             'excluded_compound_tokens': self.excluded_compound_tokens})
         
-        self.regex_tagger = RegexTagger(vocabulary=filtered_vocabulary,
-                                        output_layer='web_language',output_attributes=['pattern_type'],
-                                        conflict_resolving_strategy='ALL')
+        self.web_language_scanner = WebLanguageScanner(filtered_vocabulary)
         
-        # only used when these attribute flags are True
-        if use_missing_commas is True:
-            self.conf_param.append('clause_segmenter')
-            self.clause_segmenter = ClauseSegmenter(ignore_missing_commas=True, output_layer='ignore_missing_commas_clauses')
-            
-        if use_unknown_words is True:
-            self.conf_param.append('vabamorf_tagger')
-            self.vabamorf_tagger = VabamorfTagger(guess=False,propername=False,disambiguate=False,phonetic=False,layer_name='morph_unknown_words')
-
+        # ClauseSegmenter and VabamorfTagger are only made when they are used for the first time (see clause_segmenter and vabamorf_tagger)
+        self._taggers = {}
+    
+    @property
+    def clause_segmenter(self):
+        """ClauseSegmenter for finding missing commas. Is made on first use, because it starts a Java process."""
+        if 'clause_segmenter' not in self._taggers:
+            self._taggers['clause_segmenter'] = ClauseSegmenter(ignore_missing_commas=True, output_layer=MISSING_COMMAS_CLAUSES_LAYER, 
+                                                                   input_morph_analysis_layer=self.morph_analysis_layer)
+        return self._taggers['clause_segmenter']
+    
+    @property
+    def vabamorf_tagger(self):
+        """VabamorfTagger for finding unknown words. Is made on first use (it is not needed if texts have a reusable morph layer)."""
+        if 'vabamorf_tagger' not in self._taggers:
+            self._taggers['vabamorf_tagger'] = VabamorfTagger(guess=False,propername=False,disambiguate=False,phonetic=False,layer_name=UNKNOWN_WORDS_LAYER)
+        return self._taggers['vabamorf_tagger']
             
-    def _change_layer(self, text, layers, status):
+    def _reusable_morph_layer(self, text):
+        """Returns the existing morph layer of the text if words were analysed without guessing and propernames 
+           (as process_and_save_results.py does), otherwise None. Then unknown words have no analysis in the layer 
+           and the layer can be used instead of analysing the words again."""
+        if self.morph_analysis_layer not in text.layers:
+            return None
+        settings = text.meta.get(MORPH_ANALYSIS_SETTINGS_META)
+        if not isinstance(settings, dict) or settings.get('guess') is not False or settings.get('propername') is not False:
+            return None
+        return text[self.morph_analysis_layer]
+    
+    def retag_many(self, texts, batch_size=100, status=None):
+        """Retags many texts and returns the list of texts. 
+           Texts are processed in batches of batch_size texts: clauses of all the texts of a batch are tagged 
+           with one request to the Java-based ClauseSegmenter (see segment_clauses_in_batch), and words of the 
+           texts are analysed with Vabamorf (if needed) before any of the texts is scored."""
+        texts=list(texts)
+        for i in range(0, len(texts), batch_size):
+            batch=texts[i:i+batch_size]
+            batch_layers=[{name: text[name] for name in self.input_layers} for text in batch]
+            # in cascade mode, surface features are counted first (once: the counts are also used for scoring), 
+            # and layers are made beforehand only for texts that are not decided by surface features
+            # (in early-stop mode and chunked mode, layers are made for a few paragraphs at a time instead)
+            batch_surfaces=[self._count_surface(text, layers) if self.cascade_threshold is not None else None 
+                            for text, layers in zip(batch, batch_layers)]
+            undecided=[(text, layers) for text, layers, surface in zip(batch, batch_layers, batch_surfaces) 
+                       if self._needs_expensive_layers(text, layers, surface)]
+            if self.use_missing_commas == True and undecided:
+                start=perf_counter()
+                undecided_clauses=segment_clauses_in_batch(self.clause_segmenter, [text for text, layers in undecided])
+                for (text, layers), clauses in zip(undecided, undecided_clauses):
+                    layers[MISSING_COMMAS_CLAUSES_LAYER]=clauses
+                self._record_detector(None, "missing_commas (batch)", perf_counter()-start, 0)
+            if self.use_unknown_words == True:
+                start=perf_counter()
+                for text, layers in undecided:
+                    if self._reusable_morph_layer(text) is None:
+                        layers[UNKNOWN_WORDS_LAYER]=self.vabamorf_tagger.make_layer(text=text,status=status)
+                self._record_detector(None, "unknown_words (batch)", perf_counter()-start, 0)
+            for text, layers, surface in zip(batch, batch_layers, batch_surfaces):
+                self._change_layer(text, layers, status, surface)
+        return texts
+    
+    def paragraph_features(self, text, status=None, domain=None):
+        """Counts web language features of the paragraphs of the text without changing the paragraphs layer. 
+           Returns ParagraphFeatures: a matrix of paragraphs x output_attributes and offsets of the paragraphs.
+           domain is used for the hit rates of the paragraph cache (if the retagger has a cache)."""
+        # with a cache, other layers than paragraphs are not needed if all paragraphs are in the cache (see cached)
+        layers={name: text[name] for name in self.input_layers if self.cache is None or name in text.layers}
+        paragraph_index, attr_counts, meta=self._count_features(text, layers, status, domain)
+        return ParagraphFeatures(self.output_attributes, attr_counts, paragraph_index, meta)
+    
+    def cached(self, text):
+        """Returns True if the counts of unknown words and missing commas of all paragraphs of the text are in the 
+           paragraph cache. Then paragraph_features only needs the paragraphs layer of the text (and the layers it is made of)."""
+        if self.cache is None:
+            return False
+        paragraph_index=ParagraphSpanIndex(text[self.output_layer])
+        # (if the text has more paragraphs than the cache keeps in memory, some of them could be removed before scoring)
+        if len(paragraph_index) > self.cache.max_size:
+            return False
+        keys=self._paragraph_keys(text, paragraph_index, text['compound_tokens'])
+        return all(self.cache.get(key) is not None for key in keys)
+    
+    def _paragraph_keys(self, text, paragraph_index, compound_tokens):
+        from paragraph_cache import paragraph_key
+        configuration=self.cache_configuration+'\n'+self._cache_context(compound_tokens)
+        return [paragraph_key(text.text[start:end], configuration) 
+                for start, end in zip(paragraph_index.starts, paragraph_index.ends)]
+    
+    def _cache_context(self, compound_tokens):
+        """Returns the state of the whole text that the counts of a paragraph also depend on, as a part of the keys 
+           of the paragraph cache: unknown words of a paragraph are counted by the normalized forms of the compound 
+           tokens of the whole text (see _count_unknown_words), so a paragraph is cached separately for texts where 
+           these forms vary, are all the same (and which one) or there are none."""
+        if "unknown_words" not in self.output_attributes:
+            return ''
+        counted_normalized, varied_normalized=self._counted_normalized(compound_tokens)
+        if varied_normalized:
+            return 'varied'
+        if counted_normalized:
+            return 'same '+json.dumps(counted_normalized[0], ensure_ascii=False)
+        return 'none'
+    
+    def _change_layer(self, text, layers, status, surface=None):
         
         paragraphs=layers[self.output_layer]
-        words=layers['words']
-        compound_tokens=layers['compound_tokens']
-        clauses=layers['clauses']
         
-        web_language_layer = self.regex_tagger.make_layer(text=text,layers=layers)
-        
-        # only needed when these attribute flags are True
-        if self.use_missing_commas == True:
-            ignore_missing_commas_clauses = self.clause_segmenter.make_layer(text=text,layers=layers)
-        if self.use_unknown_words == True:
-            morph_unknown_words = self.vabamorf_tagger.make_layer(text=text,status=status)
+        paragraph_index, attr_counts, meta=self._count_features(text, layers, status, surface=surface)
         
         paragraphs.attributes = paragraphs.attributes + self.output_attributes
-
-        text_score=0 # a total number of all the attributes in a text
-        text_word_count=0 # a total number of words in a whole text
         
-        # checks if certain words belong to the same paragraph
-        def if_in_paragraph(paragraph_i, new_i): 
-            if (paragraph_i.start == new_i.start or paragraph_i.start < new_i.start) and (paragraph_i.end == new_i.end or paragraph_i.end > new_i.end):
-                return True
-            
-        # checks for clauses that shouldn't be counted as attributes 
-        # clauses that end eg with a word "ainult" if the following clause starts eg with "et"
-        def counter_comma(counter, word, new_list, clause, start_index):
-            if counter!=0:
-                if clause.text[0].lower() in [word]:
-                    new_list.append(start_index)
-                    return new_list
+        for parag_i, parag in enumerate(paragraphs):
+            for k in self.output_attributes: # adds attribute+count to paragraph layer
+                setattr(parag, k, attr_counts[k][parag_i])
+        
+        paragraphs.text_object.meta.update(meta) # adds a whole text score (and information about the modes used)
+    
+    def _count_features(self, text, layers, status, domain=None, surface=None):
+        """Counts web language features of every paragraph. Returns the paragraph index, counts of every attribute 
+           (lists with an element for every paragraph) and meta of the text (whole_text_score etc.). 
+           surface is the result of _count_surface if surface features of the text are already counted."""
+        if self.cache is not None:
+            return self._count_features_with_cache(text, layers, status, domain)
+        
+        if surface is None:
+            surface=self._count_surface(text, layers)
+        paragraph_index, word_paragraphs, attr_counts, statistics=surface
+        
+        # expensive detectors, in the order of their cost; in cascade mode a detector is skipped 
+        # (its attribute is set to None) if the label of the text is already decided
+        skipped_detectors=[]
+        paragraphs_used=len(paragraph_index)
+        if self.early_stop_threshold is not None:
+            paragraphs_used=self._count_expensive_features_in_windows(text, layers, paragraph_index, attr_counts, status, statistics, 
+                                                                      window_size=self.chunk_size or self.early_stop_window, 
+                                                                      early_stop=True)
+        else:
+            for attr in self.expensive_detectors:
+                if self.cascade_threshold is not None and self._cascade_decided(attr_counts):
+                    attr_counts[attr]=[None]*len(paragraph_index)
+                    skipped_detectors.append(attr)
+                    self.cascade_statistics['skipped_'+attr]+=1
+                elif self.chunk_size is not None:
+                    self._count_expensive_features_in_windows(text, layers, paragraph_index, attr_counts, status, statistics, 
+                                                              detectors=(attr,), window_size=self.chunk_size)
+                elif attr == "unknown_words":
+                    self._run_detector(statistics, attr, self._count_unknown_words, text, layers, paragraph_index, attr_counts, status)
+                elif attr == "missing_commas":
+                    self._run_detector(statistics, attr, self._count_missing_commas, text, layers, word_paragraphs, attr_counts)
+        
+        # a total number of all the attributes in a text divided by a total number of words in a whole text
+        text_score=sum(sum(v for v in attr_counts[k] if v is not None) for k in self.output_attributes if k != "word_count")
+        text_score=text_score / sum(attr_counts["word_count"])
+        if paragraphs_used < len(paragraph_index): # stopped early, the score is estimated from the paragraphs used
+            text_score=self._early_stop_score(self._early_stop_totals(attr_counts, paragraphs_used))[0]
+        
+        meta={'whole_text_score': text_score}
+        if self.cascade_threshold is not None:
+            self.cascade_statistics['texts']+=1
+            meta['skipped_detectors'] = skipped_detectors
+        if self.early_stop_threshold is not None:
+            meta['early_stop'] = paragraphs_used < len(paragraph_index)
+            meta['paragraphs_used'] = paragraphs_used
+        if self.instrument_meta and statistics is not None:
+            meta['detector_statistics'] = statistics
+        return paragraph_index, attr_counts, meta
+    
+    def _count_features_with_cache(self, text, layers, status, domain):
+        """Takes the counts of unknown words and missing commas of the paragraphs that are in the cache from there and 
+           counts them in the other paragraphs (in windows of consecutive paragraphs, see _count_expensive_features_in_windows), 
+           which are then added to the cache. 
+           Surface features are always counted in the whole text, like without a cache: matches of the web language 
+           patterns may start or end in the separator or in the neighbouring paragraphs (e.g. "\s[^ ]+" takes the 
+           newline before a paragraph, a match that runs into the next paragraph is not counted, but the text it takes 
+           can not be matched again), so these counts of a paragraph depend on its context."""
+        paragraph_index=ParagraphSpanIndex(layers[self.output_layer])
+        keys=self._paragraph_keys(text, paragraph_index, layers['compound_tokens'])
+        cached=[self.cache.get(key) for key in keys]
+        missing=[i for i, counts in enumerate(cached) if counts is None]
+        self.cache.statistics.count(domain, len(keys)-len(missing), len(missing))
+        
+        attr_counts={i: [0]*len(paragraph_index) for i in self.output_attributes}
+        statistics={} if self.instrument else None
+        word_paragraphs=[paragraph_index.locate(w) for w in layers['words']]
+        self._count_surface_features(text, layers, paragraph_index, word_paragraphs, attr_counts, statistics)
+        if missing:
+            self._count_expensive_features_in_windows(text, layers, paragraph_index, attr_counts, status, statistics, 
+                                                      window_size=self.chunk_size, paragraphs=missing)
+        for i, counts in enumerate(cached):
+            if counts is None:
+                self.cache.put(keys[i], [attr_counts[k][i] for k in self.expensive_detectors])
+            else:
+                for k, count in zip(self.expensive_detectors, counts):
+                    attr_counts[k][i]=count
+        
+        text_score=sum(sum(attr_counts[k]) for k in self.output_attributes if k != "word_count")
+        text_score=text_score / sum(attr_counts["word_count"])
+        meta={'whole_text_score': text_score, 'cached_paragraphs': len(keys)-len(missing)}
+        if self.instrument_meta and statistics is not None:
+            meta['detector_statistics'] = statistics
+        return paragraph_index, attr_counts, meta
+    
+    def _count_surface(self, text, layers):
+        """Builds the paragraph index of the text and counts surface features of every paragraph. 
+           Returns (paragraph_index, word_paragraphs, attr_counts, statistics)."""
+        # paragraph index is built once per text, every detector uses it to find the paragraph of a span
+        paragraph_index = ParagraphSpanIndex(layers[self.output_layer])
+        # paragraph of every word (None if the word is outside of paragraphs)
+        word_paragraphs=[paragraph_index.locate(w) for w in layers['words']]
+        
+        # by default attribute count is set to 0 in every paragraph
+        attr_counts = {i: [0]*len(paragraph_index) for i in self.output_attributes}
+        
+        # statistics of the detectors in this text (only if instrument is True)
+        statistics = {} if self.instrument else None
+        
+        self._count_surface_features(text, layers, paragraph_index, word_paragraphs, attr_counts, statistics)
+        return paragraph_index, word_paragraphs, attr_counts, statistics
+    
+    def _needs_expensive_layers(self, text, layers, surface=None):
+        """Checks if layers for counting unknown words and missing commas of the whole text should be made beforehand 
+           (always, if not in cascade mode, early-stop mode, chunked mode or with a paragraph cache). 
+           surface is the result of _count_surface (counted here if not given)."""
+        if self.early_stop_threshold is not None or self.chunk_size is not None or self.cache is not None:
+            return False
+        if self.cascade_threshold is None:
+            return True
+        if surface is None:
+            surface=self._count_surface(text, layers)
+        return not self._cascade_decided(surface[2])
+    
+    def _cascade_decided(self, attr_counts):
+        """Checks if the label of the text is decided by the attributes counted so far. 
+           Attribute counts only add to the score, so a partial score above cascade_threshold means "mittekirjak" 
+           for sure; a partial score below the uncertainty band (cascade_threshold - cascade_band) is taken as "kirjak"."""
+        word_count=sum(attr_counts["word_count"])
+        if word_count == 0:
+            return False
+        partial_score=sum(sum(v for v in counts if v is not None) 
+                          for k, counts in attr_counts.items() if k != "word_count") / word_count
+        return partial_score > self.cascade_threshold or partial_score <= self.cascade_threshold - self.cascade_band
+    
+    def _count_expensive_features_in_windows(self, text, layers, paragraph_index, attr_counts, status, statistics=None, 
+                                             detectors=None, window_size=None, early_stop=False, paragraphs=None):
+        """Counts unknown words and/or missing commas (detectors, all expensive detectors by default) window_size paragraphs 
+           at a time. Temporary layers are made for one window at a time, so they only take memory for one window. 
+           If early_stop is True, stops as soon as the label of the text can not change and sets the attributes of the 
+           paragraphs that were not used to None. Returns the number of paragraphs used. 
+           paragraphs are the (sorted) numbers of the paragraphs that are counted (all paragraphs by default); 
+           a window only has consecutive paragraphs (if window_size is None, as many as there are)."""
+        n=len(paragraph_index)
+        detectors=self.expensive_detectors if detectors is None else detectors
+        if not detectors:
+            return n
+        # layers that are cut into windows (taggers go through compound tokens together with words, 
+        # so they also get the compound tokens of the window; layers that are not given are taken from the text)
+        window_layers={'words': layers['words'], 'clauses': layers['clauses'], 
+                       'sentences': layers['sentences'] if 'sentences' in layers else text['sentences'], 
+                       'compound_tokens': layers['compound_tokens']}
+        if "unknown_words" in detectors:
+            morph_unknown_words = layers.get(UNKNOWN_WORDS_LAYER)
+            if morph_unknown_words is None:
+                morph_unknown_words = self._reusable_morph_layer(text)
+            if morph_unknown_words is not None:
+                window_layers[UNKNOWN_WORDS_LAYER]=morph_unknown_words
+        if "missing_commas" in detectors:
+            window_layers[self.morph_analysis_layer]=layers[self.morph_analysis_layer] if self.morph_analysis_layer in layers else text[self.morph_analysis_layer]
+        windows=LayerWindows(window_layers)
+        # unknown words of a window are counted by the compound tokens of the whole text (collected once per text)
+        compound_token_forms=self._compound_token_forms(layers['compound_tokens']) if "unknown_words" in detectors else None
+        # totals of the sequential test are kept up to date window by window, instead of summing all paragraphs again
+        totals=self._early_stop_totals(attr_counts, 0) if early_stop else None
+        
+        for first, last in paragraph_windows(range(n) if paragraphs is None else paragraphs, window_size):
+            window=windows.window(paragraph_index.starts[first], paragraph_index.ends[last-1])
+            window_index=paragraph_index.window(first, last)
+            window_counts={attr: [0]*(last-first) for attr in detectors}
+            if "unknown_words" in detectors:
+                self._run_detector(statistics, "unknown_words", self._count_unknown_words, 
+                                   text, window, window_index, window_counts, status, compound_token_forms)
+            if "missing_commas" in detectors:
+                window_word_paragraphs=[window_index.locate(w) for w in window['words']]
+                self._run_detector(statistics, "missing_commas", self._count_missing_commas, 
+                                   text, window, window_word_paragraphs, window_counts)
+            for attr, counts in window_counts.items():
+                attr_counts[attr][first:last]=counts
+            if early_stop:
+                totals['used_word_count']+=sum(attr_counts["word_count"][first:last])
+                totals['expensive_count']+=sum(sum(counts) for counts in window_counts.values())
+            # temporary layers of the window are released before the next window
+            del window, window_counts
+            if early_stop and last < n and self._early_stop_decided(totals):
+                for attr in detectors:
+                    attr_counts[attr][last:]=[None]*(n-last)
+                return last
+        return n
+    
+    def _early_stop_totals(self, attr_counts, paragraphs_used):
+        """Returns the totals of the sequential test after the first paragraphs_used paragraphs: words and surface features 
+           of the whole text (they do not change) and words and unknown words/missing commas of the paragraphs used 
+           (they grow with every window, see _count_expensive_features_in_windows)."""
+        return {'word_count': sum(attr_counts["word_count"]), 
+                'surface_count': sum(sum(counts) for k, counts in attr_counts.items() 
+                                     if k != "word_count" and k not in self.expensive_detectors), 
+                'used_word_count': sum(attr_counts["word_count"][:paragraphs_used]), 
+                'expensive_count': sum(sum(attr_counts[k][:paragraphs_used]) for k in self.expensive_detectors)}
+    
+    def _early_stop_score(self, totals):
+        """Estimates the whole text score from the paragraphs used (totals are made by _early_stop_totals). Surface 
+           features are counted in the whole text, the rate of unknown words and missing commas is estimated from the 
+           paragraphs used. Returns the estimated score and the standard error of the estimated rate (counts are taken 
+           as Poisson counts)."""
+        if totals['used_word_count'] == 0:
+            return 0.0, float('inf')
+        rate=totals['expensive_count'] / totals['used_word_count']
+        standard_error=max(totals['expensive_count'], 1) ** 0.5 / totals['used_word_count']
+        return totals['surface_count'] / totals['word_count'] + rate, standard_error
+    
+    def _early_stop_decided(self, totals):
+        """Sequential test: checks if the label of the text can not change after reading the rest of the paragraphs. 
+           Counts only add to the score, so the text is "mittekirjak" for sure if the score of the features found so far 
+           (divided by the number of words of the whole text) is above early_stop_threshold. If early_stop_z is set, 
+           the label is also decided if the estimated score is more than early_stop_z standard errors away from the 
+           threshold (after at least early_stop_min_words words). totals are made by _early_stop_totals."""
+        if totals['word_count'] == 0:
+            return False
+        if (totals['surface_count'] + totals['expensive_count']) / totals['word_count'] > self.early_stop_threshold:
+            return True
+        if self.early_stop_z is None or totals['used_word_count'] < self.early_stop_min_words:
+            return False
+        score, standard_error=self._early_stop_score(totals)
+        return abs(score - self.early_stop_threshold) > self.early_stop_z * standard_error
+    
+    def _run_detector(self, statistics, name, detector, *args):
+        """Runs a detector (a method that returns the number of counted spans). If statistics is not None, 
+           wall time and the number of counted spans are recorded for the text and in detector_statistics."""
+        if statistics is None:
+            return detector(*args)
+        start=perf_counter()
+        spans=detector(*args)
+        self._record_detector(statistics, name, perf_counter()-start, spans)
+        return spans
+    
+    def _record_detector(self, statistics, name, elapsed, spans):
+        """Adds a call of a detector to the statistics of the text (if not None) and to detector_statistics (if instrument is True)."""
+        if not self.instrument:
+            return
+        if statistics is not None:
+            text_statistics=statistics.setdefault(name, {'calls': 0, 'time': 0.0, 'spans': 0})
+            text_statistics['calls']+=1
+            text_statistics['time']+=elapsed
+            text_statistics['spans']+=spans
+        total_statistics=self.detector_statistics.setdefault(name, {'calls': 0, 'time': 0.0, 'spans': 0})
+        total_statistics['calls']+=1
+        total_statistics['time']+=elapsed
+        total_statistics['spans']+=spans
+    
+    def detector_report(self):
+        """Returns a table of the statistics of the detectors collected so far (if instrument is True), 
+           slowest detectors first."""
+        total_time=sum(v['time'] for v in self.detector_statistics.values())
+        lines=['{:<24}{:>10}{:>12}{:>8}{:>12}'.format('detector', 'calls', 'time (s)', '%', 'spans')]
+        for name, v in sorted(self.detector_statistics.items(), key=lambda item: -item[1]['time']):
+            share=100*v['time']/total_time if total_time else 0.0
+            lines.append('{:<24}{:>10}{:>12.3f}{:>8.1f}{:>12}'.format(name, v['calls'], v['time'], share, v['spans']))
+        return '\n'.join(lines)
+    
+    def _count_surface_features(self, text, layers, paragraph_index, word_paragraphs, attr_counts, statistics=None):
+        """Counts web language matches, emoticons and words of every paragraph."""
+        self._run_detector(statistics, "web_language", self._count_web_language_matches, 
+                           text, layers, paragraph_index, attr_counts)
+        if self.use_emoticons == True: # attribute "emoticons"
+            self._run_detector(statistics, "emoticons", self._count_emoticons, layers, paragraph_index, attr_counts)
+        self._run_detector(statistics, "word_count", self._count_words, word_paragraphs, attr_counts)
+    
+    def _count_web_language_matches(self, text, layers, paragraph_index, attr_counts):
+        """Counts matches of the web language patterns in every paragraph."""
+        web_language_matches = self.web_language_scanner.scan(text.text)
+        
+        # matches inside of such compound tokens are not counted 
+        excluded_spans=ExcludedSpanIndex(layers['compound_tokens'], self.excluded_compound_tokens)
+        counted=0
+        for i in web_language_matches:
+            parag_i=paragraph_index.locate(i)
+            if parag_i is not None and not excluded_spans.overlaps(i):
+                attr_counts[i.pattern_type][parag_i] += 1
+                counted+=1
+        return counted
+    
+    def _count_emoticons(self, layers, paragraph_index, attr_counts):
+        """Counts emoticons (compound tokens) in every paragraph."""
+        counted=0
+        for cp in layers['compound_tokens']:
+            if "emoticon" in cp.type:
+                parag_i=paragraph_index.locate(cp)
+                if parag_i is not None:
+                    attr_counts["emoticons"][parag_i] += 1
+                    counted+=1
+        return counted
+    
+    def _count_words(self, word_paragraphs, attr_counts):
+        """Counts words in every paragraph."""
+        # the number of words in a paragraph  
+        counted=0
+        for parag_i in word_paragraphs:
+            if parag_i is not None:
+                attr_counts["word_count"][parag_i] += 1
+                counted+=1
+        return counted
+    
+    def _count_missing_commas(self, text, layers, word_paragraphs, attr_counts):
+        """Counts clauses with a missing comma in every paragraph."""
+        # (retag_many makes this layer for a batch of texts beforehand)
+        ignore_missing_commas_clauses = layers.get(MISSING_COMMAS_CLAUSES_LAYER)
+        if ignore_missing_commas_clauses is None:
+            ignore_missing_commas_clauses = self.clause_segmenter.make_layer(text=text,layers=layers)
+        
+        clause_index=ClauseBoundaryIndex(layers['clauses'], ignore_missing_commas_clauses)
+        counted=0
+        for w, parag_i in zip(layers['words'], word_paragraphs):
+            if parag_i is not None:
+                missing_commas=clause_index.missing_commas(w)
+                attr_counts["missing_commas"][parag_i] += missing_commas
+                counted+=missing_commas
+        return counted
+    
+    def _count_unknown_words(self, text, layers, paragraph_index, attr_counts, status, compound_token_forms=None):
+        """Counts unknown words (words without a morphological analysis) in every paragraph. 
+           compound_token_forms is the result of _compound_token_forms for the compound tokens of the whole text 
+           (made from layers['compound_tokens'] by default)."""
+        # (retag_many makes this layer for a batch of texts beforehand; in early-stop mode the layer may be 
+        # an empty window of the layer, so it is compared with None)
+        morph_unknown_words = layers.get(UNKNOWN_WORDS_LAYER)
+        if morph_unknown_words is None:
+            morph_unknown_words = self._reusable_morph_layer(text)
+        if morph_unknown_words is None:
+            morph_unknown_words = self.vabamorf_tagger.make_layer(text=text,layers=layers,status=status)
+        if compound_token_forms is None:
+            compound_token_forms=self._compound_token_forms(layers['compound_tokens'])
+        counted_normalized, varied_normalized, compound_token_starts=compound_token_forms
         
         # checks if a word consists of letters/numbers
         def validateString(s):
@@ -165,98 +977,33 @@ class ParagraphWebLanguageScoreRetagger(Retagger):
                     flag = True
             return flag                
         
-        
-        for parag in paragraphs:
-            
-            word_list=[] # a total number of words in a paragraph
-            attr_dict=defaultdict(int) # attributes counted separately in a paragraph
-            
-            for i in self.output_attributes: # by default attribute count is set to 0
-                if i != "emoticons" or i != "missing_commas" or i != "unknown_words":
-                    attr_dict[i]=0
-                
-            for i in web_language_layer:
-                if if_in_paragraph(parag, i) == True:
-                    check=0
-                    attr=i.pattern_type
-                    for cp in compound_tokens:
-                        # such compound tokens are not counted 
-                        if "www_address" in cp.type or "email" in cp.type or "non_ending_abbreviation": 
-                            for item in cp:
-                                if conflict(i,item):
-                                    check+=1
-                    if check==0:
-                        attr_dict[attr] += 1
-                        
-            if self.use_emoticons == True: # attribute "emoticons"
-                attr_dict["emoticons"]=0
-                for cp in compound_tokens:
-                    if "emoticon" in cp.type:
-                        if if_in_paragraph(parag, cp) == True:
-                            attr_dict["emoticons"] += 1
-                        
-            # finds clauses with a missing comma
-            if self.use_missing_commas == True:
-                attr_dict["missing_commas"]=0
-                not_suitable=[]
-                for w in words:
-                    if if_in_paragraph(parag, w) == True:
-                        counter=0
-                        counter2=0
-                        for cl in ignore_missing_commas_clauses:
-                            if cl.end==w.start-1:
-                                if cl.text[-1].lower() in ["ainult","vaevalt","peaasi","mitte","ilma","olgugi","nii","sellepärast","selleks","et","sest","aga","kuid","vaid","siis","ja","ning","ega","ehk","või","palun"]:
-                                    not_suitable.append(w.start)
-                                    counter+=1
-                                if cl.text[-1].lower() in ["juhul","enne","isegi","siis"]:
-                                    counter2+=1
-                                
-                            if cl.start==w.start:
-                                counter_comma(counter,"et",not_suitable,cl,w.start)
-                                counter_comma(counter2,"kui",not_suitable,cl,w.start)
-                            
-                        if w.start not in [c.start for c in clauses if c]: # indexes of the beginnings of clauses
-                            if w.start in [c.start for c in ignore_missing_commas_clauses if c]: # indexes of the beginnings of clauses (also detects clauses that have a missing comma)
-                                for cl in ignore_missing_commas_clauses:
-                                    if w.start==cl.start: # if the start index of a clause is only in ignore_missing_commas_clauses, it means there is a missing comma
-                                        if w.start not in not_suitable: # 
-                                            if w.text != "palun":
-                                                attr_dict["missing_commas"] += 1
-                    
-
-            # the number of words in a paragraph  
-            for w in words:
-                if if_in_paragraph(parag, w) == True:
-                    word_list.append(w)
-                            
-            # finds unknown words in a paragraph
-            if self.use_unknown_words == True:
-                attr_dict["unknown_words"]=0
-                for morph in morph_unknown_words:
-                    if if_in_paragraph(parag, morph) == True:
-                        if morph[0].lemma==None:
-                            if validateString(morph[0].text)==True:
-                                match2=re.match("^[A-ZÜÕÄÖŠŽ]{1,}",morph[0].text)
-                                count=0
-                                for t,t2 in zip(compound_tokens.normalized, compound_tokens.type):
-                                    if morph[0].text!=t and "emoticon" not in t2 and "name_with_initial" not in t2 and not match2:
-                                        count+=1 # such compound tokens are not counted as unknown words             
-                                if count !=0:
-                                    attr_dict["unknown_words"] += 1
-                                if morph[0].start not in text.compound_tokens["start"] and not match2:
-                                    attr_dict["unknown_words"] += 1
-                                        
-            attr_dict["word_count"]=len(word_list)  
-                    
-            summary=0 # a total number of different attributes in a paragraph
-            
-            for k,v in attr_dict.items(): # adds attribute+count to paragraph layer
-                setattr(parag, k, v)
-                if k != "word_count":
-                    summary+=v
-
-            text_score+=summary
-            text_word_count+=parag.word_count
- 
-        text_score=text_score / text_word_count
-        paragraphs.text_object.meta['whole_text_score'] = text_score # adds a whole text score
+        counted=0
+        for morph in morph_unknown_words:
+            parag_i=paragraph_index.locate(morph)
+            if parag_i is not None:
+                if morph[0].lemma==None:
+                    if validateString(morph.text)==True:
+                        match2=re.match("^[A-ZÜÕÄÖŠŽ]{1,}",morph.text)
+                        if not match2:
+                            if varied_normalized or (counted_normalized and morph.text!=counted_normalized[0]):
+                                attr_counts["unknown_words"][parag_i] += 1
+                                counted+=1
+                            if morph.start not in compound_token_starts:
+                                attr_counts["unknown_words"][parag_i] += 1
+                                counted+=1
+        return counted
+    
+    def _counted_normalized(self, compound_tokens):
+        """Returns normalized forms of the compound tokens that are not counted as unknown words (all but emoticons and 
+           names with initials) and whether these forms vary. Forms are collected once per text, instead of rescanning 
+           compound tokens for every word."""
+        counted_normalized=[t for t,t2 in zip(compound_tokens.normalized, compound_tokens.type) 
+                            if "emoticon" not in t2 and "name_with_initial" not in t2]
+        varied_normalized=any(t!=counted_normalized[0] for t in counted_normalized)
+        return counted_normalized, varied_normalized
+    
+    def _compound_token_forms(self, compound_tokens):
+        """Returns what unknown words are counted by: normalized forms of the compound tokens (see _counted_normalized), 
+           whether they vary and start positions of the compound tokens."""
+        counted_normalized, varied_normalized=self._counted_normalized(compound_tokens)
+        return counted_normalized, varied_normalized, {cp.start for cp in compound_tokens}
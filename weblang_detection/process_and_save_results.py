@@ -15,29 +15,61 @@
 import os, os.path
 import argparse
 import pickle
+import json
+import heapq
+import signal
+import codecs
+import hashlib
+from time import perf_counter
+from itertools import chain
+from collections import deque, defaultdict
+from functools import partial
+from multiprocessing import Pool, Process, Pipe
+from multiprocessing.connection import wait
 
 from datetime import datetime 
 from datetime import timedelta
 
 from estnltk import Text
-from estnltk.taggers import SentenceTokenizer
 from estnltk.taggers.morph_analysis.gt_morf import GTMorphConverter
 from estnltk.taggers.syntax_preprocessing.syntax_ignore_tagger import SyntaxIgnoreTagger
 from estnltk.resolve_layer_dag import make_resolver
-from estnltk.converters import json_to_text, text_to_json
+from estnltk.converters import json_to_text, text_to_json, text_to_dict
+
+from text_container import TextContainerWriter, TextContainerReader
+from packed_corpus import PackedCorpus, is_packed_corpus, document_sizes
+from dedup import DuplicateIndex
 
 #from corpus_processing.parse_koondkorpus import get_text_subcorpus_name
 
-skip_existing         = True   # skip existing files (continue analysis where it stopped previously)
+skip_existing         = True   # skip files completed in the run journal, or existing files if there is no journal
+                               # (continue analysis where it stopped previously)
 skip_saving           = False  # skip saving (for debugging purposes)
 record_sentence_fixes = False   # record types of sentence postcorrections (for debugging purposes)
 add_clauses           = True   # add layer 'clauses'
 add_syntax_ignore     = False   # add layer 'syntax_ignore'
 add_gt_morph_analysis = False   # add layer 'gt_morph_analysis'
 
+# settings of the morphological analysis; these are also recorded in text.meta['morph_analysis_settings'],
+# so that paragraphweblanguagescoreretagger can find unknown words from the layer without analysing words again
+morph_analysis_settings = { 'disambiguate': False, 'guess': False, 'propername': False, 
+                            'phonetic': False, 'compound': True }
+
+# stages of the analysis and the layers made in them (in the order of making them)
+stage_layers = [ ('tokenization', 'words'), ('paragraphs', 'paragraphs'), ('morph_analysis', 'morph_analysis'), 
+                 ('clauses', 'clauses'), ('gt_morph', 'gt_morph_analysis'), ('syntax_ignore', 'syntax_ignore') ]
+# other layers that can be given with --target (made by the resolver)
+other_layers = [ 'tokens', 'compound_tokens', 'sentences', 'morph_extended' ]
+# layers needed by the consumers of the output (for --target)
+consumer_layers = { 
+    # ParagraphWebLanguageScoreRetagger (morph_analysis is reused for finding unknown words)
+    'weblang': ['paragraphs', 'compound_tokens', 'clauses', 'morph_analysis'],
+    # NormalizeWordsRetagger
+    'normalization': ['words'] }
+
 input_ext     = '.json'     # extension of input files
 corpus_type   = 'ettenten'  # 'koond' or 'ettenten'
-output_format = 'json'      # 'json' or 'pickle'
+output_format = 'json'      # 'json', 'pickle' or 'container' (see text_container.py)
 
 skip_list     = []          # files to be skipped (for debugging purposes)
 
@@ -69,6 +101,429 @@ def load_in_file_names( fnm ):
     return filenames
 
 
+def load_journal( fnm ):
+    ''' Loads the run journal: a JSONL file with a record about every 
+        analysed input file (written by append_jsonl). Returns a dict 
+        from input file names to their last records. Lines that can not 
+        be parsed (e.g. the last line of a crashed run) are ignored.
+    '''
+    records = {}
+    with open(fnm, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads( line )
+            except ValueError:
+                continue
+            records[record['input']] = record
+    return records
+
+
+def append_jsonl( f, record ):
+    ''' Appends a record to an open JSONL file (the run journal or the 
+        metrics file) and flushes it, so that the record is not lost if 
+        the run crashes.
+    '''
+    f.write( json.dumps( record, ensure_ascii=False )+'\n' )
+    f.flush()
+
+
+class ProgressMeter:
+    ''' Counts analysed documents and words of a run. Rates (documents 
+        and words per second) are rolling: they are computed over the 
+        documents finished during the last window seconds.
+    '''
+    def __init__( self, total, window=300 ):
+        self.total = total
+        self.window = window
+        self.start = perf_counter()
+        self.recent = deque()
+        self.documents = 0
+        self.words = 0
+
+    def add( self, words ):
+        now = perf_counter()
+        self.recent.append( (now, words) )
+        self.documents += 1
+        self.words += words
+        while self.recent[0][0] < now - self.window:
+            self.recent.popleft()
+
+    def report( self ):
+        ''' Returns a dict with the numbers of documents and words, rolling 
+            rates and the estimated time left (seconds). '''
+        now = perf_counter()
+        span = min( self.window, now - self.start )
+        docs_per_sec = len( self.recent ) / span if span > 0 else 0.0
+        words_per_sec = sum( words for t, words in self.recent ) / span if span > 0 else 0.0
+        left = self.total - self.documents
+        return { 'type': 'progress', 'elapsed': round( now - self.start, 3 ), 
+                 'documents': self.documents, 'total': self.total, 'words': self.words, 
+                 'docs_per_sec': round( docs_per_sec, 3 ), 'words_per_sec': round( words_per_sec, 1 ),
+                 'eta': round( left / docs_per_sec, 1 ) if docs_per_sec > 0 else None }
+
+
+def save_text( text, ofnm, output_format ):
+    ''' Saves text into a temporary file and renames it to ofnm, so 
+        that an interrupted run does not leave a truncated output file.
+    '''
+    tmp_fnm = '{}.{}.tmp'.format( ofnm, os.getpid() )
+    try:
+        if output_format == 'pickle':
+           with open( tmp_fnm, 'wb' ) as fout:
+                pickle.dump(text, fout)
+        else:
+           text_to_json(text, file=tmp_fnm)
+        os.replace( tmp_fnm, ofnm )
+    except BaseException:
+        if os.path.exists( tmp_fnm ):
+            os.remove( tmp_fnm )
+        raise
+
+
+# =======  Processing of a file
+
+def layer_plan( targets=None ):
+    ''' Returns the list of the layers to be made as pairs (stage, layer), 
+        and the list of the layers asked for. targets are names of layers 
+        or consumers (see consumer_layers); if targets is None, the layers 
+        switched on by the add_* flags are made. The resolver also makes 
+        the layers that the layers of the plan depend on.
+    '''
+    if targets is None:
+        layers = ['words', 'paragraphs', 'morph_analysis']
+        if add_clauses:
+            layers.append( 'clauses' )
+        if add_gt_morph_analysis:
+            layers.append( 'gt_morph_analysis' )
+        if add_syntax_ignore:
+            layers.append( 'syntax_ignore' )
+    else:
+        layers = []
+        for target in targets:
+            layers.extend( consumer_layers.get( target, [target] ) )
+    plan = [ (stage, layer) for stage, layer in stage_layers if layer in layers ]
+    plan.extend( (layer, layer) for layer in other_layers if layer in layers )
+    return plan, list( dict.fromkeys( layers ) )
+
+
+def drop_layers( text, keep ):
+    ''' Removes the layers of the text that are not in keep and are not 
+        needed by the layers in keep (as their parent or enveloped layers).
+    '''
+    needed = set()
+    stack = [ name for name in keep if name in text.layers ]
+    while stack:
+        name = stack.pop()
+        if name not in needed:
+            needed.add( name )
+            stack.extend( dependency for dependency in (text[name].parent, text[name].enveloping) if dependency is not None )
+    for name in sorted( text.layers - needed ):
+        text.pop_layer( name, cascading=False )
+
+
+# packed corpora opened by the current process
+packed_corpora = {}
+
+def read_input( in_dir, in_file_name, packed=False ):
+    ''' Returns the contents (bytes) of an input file from in_dir. If 
+        packed is True, in_dir is a packed corpus (see packed_corpus.py), 
+        and the document is read from there: a document that is not 
+        compressed is returned as a memoryview of the mapped shard, 
+        which can be hashed and decoded (codecs.decode) without copying. 
+    '''
+    if packed:
+        if in_dir not in packed_corpora:
+            packed_corpora[in_dir] = PackedCorpus( in_dir )
+        return packed_corpora[in_dir].raw( in_file_name )
+    with open( os.path.join( in_dir, in_file_name ), 'rb' ) as f:
+        return f.read()
+
+
+# taggers of the current process: made once by init_taggers() in the main 
+# process, or in every worker process if the files are processed in parallel
+taggers = {}
+
+def init_taggers():
+    ''' Makes the taggers used by process_file(). The resolver contains 
+        the tokenizers (incl SentenceTokenizer), the morphological analyser 
+        and the clause segmenter, so that every process starts its own 
+        Java process for clause segmentation.
+    '''
+    taggers['resolver'] = make_resolver( **morph_analysis_settings )
+    # taggers that are not used are not made
+    taggers['syntax_ignore_tagger'] = SyntaxIgnoreTagger() if add_syntax_ignore else None
+    taggers['gt_converter'] = GTMorphConverter() if add_gt_morph_analysis else None
+
+
+def add_layers( text, plan, begin_stage=None ):
+    ''' Adds the layers of the plan (pairs (stage, layer), see layer_plan) 
+        to the text with the taggers of the current process. begin_stage 
+        is called with the name of every stage before it starts.
+    '''
+    if not taggers:
+        init_taggers()
+    resolver = taggers['resolver']
+    for stage, layer in plan:
+        if begin_stage is not None:
+            begin_stage( stage )
+        if layer == 'gt_morph_analysis':
+            if taggers.get( 'gt_converter' ) is None:
+                taggers['gt_converter'] = GTMorphConverter()
+            text.tag_layer( taggers['gt_converter'].input_layers, resolver=resolver )
+            taggers['gt_converter'].tag( text )
+        elif layer == 'syntax_ignore':
+            if taggers.get( 'syntax_ignore_tagger' ) is None:
+                taggers['syntax_ignore_tagger'] = SyntaxIgnoreTagger()
+            text.tag_layer( taggers['syntax_ignore_tagger'].input_layers, resolver=resolver )
+            taggers['syntax_ignore_tagger'].tag( text )
+        else:
+            text.tag_layer( [layer], resolver=resolver )
+    if 'morph_analysis' in text.layers:
+        text.meta['morph_analysis_settings'] = dict( morph_analysis_settings )
+
+
+def process_file( in_dir, corpus_type, output_format, task, packed=False, on_stage=None, plan=None, keep=None ):
+    ''' Analyses the input file and saves the results. task is a pair 
+        (in_file_name, ofnm), where ofnm is the name of the output file.
+        Returns a record for the run journal: the input file, its sha1 
+        hash, the output file, status ('done' if the output was saved, 
+        'analysed' if saving is skipped, or 'error') and the error.
+        record['metrics'] has the number of words, the total time and 
+        the time of every stage (seconds), and the id of the process.
+        If output_format is 'container', the text is not saved, but the 
+        record contains its text dict, which is written by the main process.
+        on_stage is called with the name of every stage when it starts.
+        plan is the list of (stage, layer) pairs made by layer_plan() (by 
+        default, the layers switched on by the add_* flags). If keep is 
+        given, other layers are dropped before saving (see drop_layers).
+    '''
+    in_file_name, ofnm = task
+    if plan is None:
+        plan = layer_plan()[0]
+    record = { 'input': in_file_name, 'sha1': None, 'output': ofnm, 'status': 'analysed', 'error': None }
+    stages = {}
+    metrics = { 'words': 0, 'seconds': 0.0, 'stages': stages, 'worker': os.getpid() }
+    record['metrics'] = metrics
+    start = stage_start = perf_counter()
+    current_stage = None
+    def begin_stage( stage ):
+        # ends the current stage and starts the next one (None ends the last stage)
+        nonlocal stage_start, current_stage
+        now = perf_counter()
+        if current_stage is not None:
+            stages[current_stage] = round( now - stage_start, 4 )
+        current_stage, stage_start = stage, now
+        if on_stage is not None and stage is not None:
+            on_stage( stage )
+    try:
+        # Load input text from JSON
+        begin_stage( 'load' )
+        data = read_input( in_dir, in_file_name, packed=packed )
+        record['sha1'] = hashlib.sha1( data ).hexdigest()
+        text = json_to_text( codecs.decode( data, 'utf-8' ) )
+        # 0) Add metadata
+        if corpus_type.lower() == 'koond':
+            text_subcorpus = get_text_subcorpus_name( in_dir, in_file_name )
+            text.meta['subcorpus'] = str(text_subcorpus)
+
+        # 1)-5) Add the layers of the plan: basic/tokenization annotations, 
+        #       morphological analysis, clauses, GT format of morph analyses, 
+        #       syntax_ignore (only the layers that are needed are made)
+        add_layers( text, plan, begin_stage=begin_stage )
+        if 'words' in text.layers:
+            metrics['words'] = len( text['words'] )
+        if keep is not None:
+            drop_layers( text, keep )
+
+        # 6) Save results
+        if not skip_saving:
+            begin_stage( 'save' )
+            if output_format == 'container':
+                record['text_dict'] = text_to_dict( text )
+            else:
+                save_text( text, ofnm, output_format )
+            record['status'] = 'done'
+    # X) Errors are logged by the main process
+    except Exception as err:
+        record['status'] = 'error'
+        record['error'] = str(err)
+    begin_stage( None )
+    metrics['seconds'] = round( perf_counter() - start, 4 )
+    return record
+
+
+
+# =======  Supervised workers (time and memory budget of a file)
+
+def resident_memory( pid ):
+    ''' Returns the resident memory (bytes) of a process, or None if it 
+        is not known (it is read from /proc, so only Linux is supported).
+    '''
+    try:
+        with open( '/proc/{}/statm'.format(pid), 'r' ) as f:
+            return int( f.read().split()[1] ) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def descendants( pid ):
+    ''' Returns the pids of the child processes of a process and their 
+        children (e.g. the Java processes of the taggers of a worker), 
+        read from /proc.
+    '''
+    children = defaultdict( list )
+    for entry in os.listdir( '/proc' ):
+        if not entry.isdigit():
+            continue
+        try:
+            with open( '/proc/{}/stat'.format(entry), 'r' ) as f:
+                # the name of the process is in parentheses and may contain spaces; ppid is the second field after it
+                ppid = int( f.read().rsplit( ')', 1 )[1].split()[1] )
+        except (OSError, ValueError, IndexError):
+            continue
+        children[ppid].append( int(entry) )
+    found = []
+    stack = [ pid ]
+    while stack:
+        for child in children.get( stack.pop(), [] ):
+            found.append( child )
+            stack.append( child )
+    return found
+
+
+def tree_memory( pid ):
+    ''' Returns the resident memory (bytes) of a process together with 
+        its child processes, or None if it is not known.
+    '''
+    memory = resident_memory( pid )
+    if memory is None:
+        return None
+    try:
+        pids = descendants( pid )
+    except OSError:
+        return memory
+    return memory + sum( resident_memory( child ) or 0 for child in pids )
+
+
+def supervised_worker( connection, process_task ):
+    ''' Runs in a worker process of SupervisedWorkers: analyses files 
+        received from connection one at a time, and sends back the name 
+        of every stage when it starts and finally the record of the file.
+    '''
+    if hasattr( os, 'setpgrp' ):
+        # the worker and its Java processes get their own process group, so that they can be killed together
+        os.setpgrp()
+    init_taggers()
+    on_stage = lambda stage: connection.send( ('stage', stage) )
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        connection.send( ('record', process_task( task, on_stage=on_stage )) )
+
+
+class SupervisedWorkers:
+    ''' Worker processes that analyse files under a budget. A worker 
+        that works on a file longer than timeout seconds, or uses more 
+        than max_memory bytes of resident memory (together with its 
+        child processes, e.g. the Java processes of the taggers), is 
+        killed (with its Java processes) and replaced by a new worker; the file 
+        gets status 'quarantined', with the reason and the stage where 
+        it was stopped. A worker that dies is treated the same way.
+    '''
+    def __init__( self, jobs, process_task, timeout=None, max_memory=None, poll_interval=1.0 ):
+        self.process_task = process_task
+        self.timeout = timeout
+        self.max_memory = max_memory
+        self.poll_interval = poll_interval
+        self.workers = [ self._start() for i in range( jobs ) ]
+
+    def _start( self ):
+        connection, worker_connection = Pipe()
+        process = Process( target=supervised_worker, args=(worker_connection, self.process_task), daemon=True )
+        process.start()
+        worker_connection.close()
+        return { 'process': process, 'connection': connection, 'task': None, 'stage': None, 'started': None }
+
+    def _kill( self, worker ):
+        try:
+            os.killpg( worker['process'].pid, signal.SIGKILL )
+        except (AttributeError, OSError):
+            # no process groups on this platform, or the worker has not made its group yet
+            worker['process'].kill()
+        worker['process'].join()
+        worker['connection'].close()
+
+    def _quarantine( self, worker, reason ):
+        in_file_name, ofnm = worker['task']
+        seconds = perf_counter() - worker['started']
+        return { 'input': in_file_name, 'sha1': None, 'output': ofnm, 'status': 'quarantined', 
+                 'error': '{} in stage {} after {:.1f} s'.format( reason, worker['stage'], seconds ),
+                 'reason': reason, 'stage': worker['stage'],
+                 'metrics': { 'words': 0, 'seconds': round( seconds, 4 ), 'stages': {}, 'worker': worker['process'].pid } }
+
+    def run( self, tasks ):
+        ''' Analyses the tasks (pairs (in_file_name, ofnm)) and yields 
+            their records in the order they are finished.
+        '''
+        tasks = deque( tasks )
+        while True:
+            for worker in self.workers:
+                if worker['task'] is None and tasks:
+                    worker['task'] = tasks.popleft()
+                    worker['stage'] = None
+                    worker['started'] = perf_counter()
+                    worker['connection'].send( worker['task'] )
+            busy = [ worker['connection'] for worker in self.workers if worker['task'] is not None ]
+            if not busy:
+                break
+            ready = wait( busy, timeout=self.poll_interval )
+            for i, worker in enumerate( self.workers ):
+                if worker['task'] is None:
+                    continue
+                reason = None
+                if worker['connection'] in ready:
+                    try:
+                        while worker['task'] is not None and worker['connection'].poll():
+                            kind, value = worker['connection'].recv()
+                            if kind == 'stage':
+                                worker['stage'] = value
+                            else:
+                                worker['task'] = None
+                                yield value
+                    except (EOFError, OSError):
+                        reason = 'crashed'
+                    if worker['task'] is None:
+                        continue
+                if reason is None and self.timeout is not None and perf_counter() - worker['started'] > self.timeout:
+                    reason = 'timeout'
+                if reason is None and self.max_memory is not None and \
+                   ( tree_memory( worker['process'].pid ) or 0 ) > self.max_memory:
+                    reason = 'memory'
+                if reason is not None:
+                    record = self._quarantine( worker, reason )
+                    self._kill( worker )
+                    self.workers[i] = self._start()
+                    yield record
+
+    def close( self ):
+        for worker in self.workers:
+            try:
+                worker['connection'].send( None )
+            except OSError:
+                pass
+        for worker in self.workers:
+            worker['process'].join( timeout=10 )
+            if worker['process'].is_alive():
+                self._kill( worker )
+        self.workers = []
+
+
 # The main program
 if __name__ == '__main__':
     # =======  Parse input arguments
@@ -84,7 +539,8 @@ if __name__ == '__main__':
                                       help='the directory containing input files; '+\
                                            'Input files should be JSON files in UTF-8 encoding. '+\
                                            "It is expected that EstNLTK's function export_json "+\
-                                           'was used for creating the files.'
+                                           'was used for creating the files. '+\
+                                           'Can also be a packed corpus made by pack_corpus.py.'
     )
     arg_parser.add_argument('--in_files', default = None, \
                                           help='a text file containing names of the input '+\
@@ -92,8 +548,9 @@ if __name__ == '__main__':
                                                'analysed. File names should be separated by newlines. '+\
                                                'Use this argument to specify a subset of files to be '+\
                                                'analysed while parallelizing the analysis process. '+\
-                                               'You can use the script "split_large_corpus_files_into_subsets.py" '+\
-                                               'for splitting the input corpus into subsets of files.')
+                                               'You can use the script "split_corpus_into_subsets.py" '+\
+                                               'for splitting the input corpus into subsets of files '+\
+                                               'of equal total size.')
     arg_parser.add_argument('out_dir', default = None, \
                                         help='the output directory where the results '+\
                                              'of analysis (one output file per each input file) '+\
@@ -110,6 +567,75 @@ if __name__ == '__main__':
                                              'and therefore the recommended format for processing large '+\
                                              'corpora is json.', \
                                              action='store_true')
+    arg_parser.add_argument('--container', default = False,
+                                        help='If set, then saves the results into a compact container '+\
+                                             '(compressed shards with dictionary-encoded attribute values, '+\
+                                             'see text_container.py) in out_dir instead of one file per '+\
+                                             'input file.', \
+                                             action='store_true')
+    arg_parser.add_argument('--shard_size', type=int, default = 1000,
+                                        help='number of documents in a shard of the container (default: 1000).')
+    arg_parser.add_argument('--compression', default = None, choices=['gzip', 'zstd'],
+                                        help='compression of the documents of the container (default: zstd '+\
+                                             'if the module zstandard is installed, otherwise gzip).')
+    arg_parser.add_argument('--jobs', type=int, default = 1,
+                                        help='number of worker processes analysing files in '+\
+                                             'parallel (default: 1). Every worker makes its own '+\
+                                             'taggers once and reuses them for all of its files.')
+    arg_parser.add_argument('--journal', default = None,
+                                        help='the run journal (JSONL file) where every analysed '+\
+                                             'input file is recorded (default: __journal.jsonl in '+\
+                                             'out_dir). Files that are completed in the journal '+\
+                                             'are skipped, and files that failed are analysed again.')
+    arg_parser.add_argument('--target', nargs='+', default = None,
+                                        help='layers or consumers of the output that the analysis is made for: '+\
+                                             'only these layers and the layers they depend on are made. '+\
+                                             'Consumers: "weblang" (ParagraphWebLanguageScoreRetagger: paragraphs, '+\
+                                             'compound_tokens, clauses, morph_analysis) and "normalization" '+\
+                                             '(NormalizeWordsRetagger: words). Layers: '+\
+                                             ', '.join( [layer for stage, layer in stage_layers] + other_layers )+'. '+\
+                                             'By default, the layers set at the beginning of the script are made.')
+    arg_parser.add_argument('--drop_intermediate', default = False,
+                                        help='If set, then only the --target layers (and the layers that they '+\
+                                             'are built on) are saved.', \
+                                             action='store_true')
+    arg_parser.add_argument('--timeout', type=float, default = None,
+                                        help='time limit of analysing a file (seconds). A worker that exceeds '+\
+                                             'it is killed and restarted, and the file is recorded in '+\
+                                             '__quarantine.jsonl in out_dir with the stage where it was stopped.')
+    arg_parser.add_argument('--max_memory', type=float, default = None,
+                                        help='memory limit of a worker process (resident memory of the worker '+\
+                                             'and its Java processes, megabytes); works as --timeout.')
+    arg_parser.add_argument('--retry_factor', type=float, default = 4,
+                                        help='quarantined files are analysed again at the end of the run, with '+\
+                                             'limits that are retry_factor times larger (default: 4; 0 switches '+\
+                                             'the retry off).')
+    arg_parser.add_argument('--order', default = 'listing', choices = ['listing', 'size'],
+                                        help='order of analysing the files: "listing" (default) keeps '+\
+                                             'the order of the folder or --in_files; "size" starts with '+\
+                                             'the largest files, so that a large file does not leave one '+\
+                                             'worker running alone at the end of the run (sizes are looked '+\
+                                             'up only for the files that are analysed in this run).')
+    arg_parser.add_argument('--metrics', default = None,
+                                        help='JSONL file of the metrics of the run (default: __metrics.jsonl in '+\
+                                             'out_dir): words, time and time of every stage of every document, '+\
+                                             'progress reports and a summary with the slowest documents.')
+    arg_parser.add_argument('--report_every', type=float, default = 60,
+                                        help='seconds between progress reports (rolling documents/sec, '+\
+                                             'words/sec and ETA; default: 60).')
+    arg_parser.add_argument('--slowest', type=int, default = 10,
+                                        help='number of the slowest documents reported at the end (default: 10).')
+    arg_parser.add_argument('--dedup', default = None,
+                                        help='the duplicate index (SQLite file, see dedup.py). If set, then exact '+\
+                                             'and near-duplicates of documents of this run and of earlier runs '+\
+                                             'with the same index are not analysed.')
+    arg_parser.add_argument('--dedup_threshold', type=float, default = 0.8,
+                                        help='Jaccard similarity of word shingles from which a document is a '+\
+                                             'near-duplicate (default: 0.8).')
+    arg_parser.add_argument('--duplicates', default = 'skip', choices = ['skip', 'link'],
+                                        help='"skip" (default) records duplicates in the journal with the '+\
+                                             'output of their canonical document; "link" also makes their '+\
+                                             'output files as hard links to the output of the canonical document.')
 
     args     = arg_parser.parse_args()
     in_dir   = args.in_dir  if os.path.isdir(args.in_dir)  else None
@@ -118,34 +644,72 @@ if __name__ == '__main__':
     if args.in_files and not os.path.isfile(args.in_files):
         print(' Unable to load input from',in_files,'...' )
     output_format = 'pickle' if args.pickle==True else 'json'
+    if args.container:
+        output_format = 'container'
+    if args.target:
+        unknown = [ target for target in args.target if target not in consumer_layers and 
+                    target not in other_layers and target not in [layer for stage, layer in stage_layers] ]
+        if unknown:
+            arg_parser.error( 'unknown --target: '+', '.join( unknown ) )
+    if args.drop_intermediate and not args.target:
+        arg_parser.error( '--drop_intermediate needs --target' )
     corpus_type   = 'koond' if args.koond==True else 'ettenten'
 
     if out_dir and in_dir:
         assert corpus_type and corpus_type.lower() in ['koond', 'ettenten']
-        assert output_format and output_format.lower() in ['json', 'pickle']
+        assert output_format and output_format.lower() in ['json', 'pickle', 'container']
         # =======  Collect input files
         print(' Type of the input corpus: ', corpus_type)
-        if not in_files:
+        packed = is_packed_corpus( in_dir )
+        if packed:
+            print(' Input is a packed corpus.')
+        if not in_files and packed:
+            with PackedCorpus( in_dir ) as corpus:
+                all_files = corpus.doc_ids()
+        elif not in_files:
             all_files = os.listdir( in_dir )
         else:
             print(' Loading input from',in_files,'...' )
             all_files = load_in_file_names( in_files )
         print('*'*70)
         print(' Found',len(all_files),' files.')
-        # =======  Initialize
-        sentence_tokenizer   = SentenceTokenizer()
-        syntax_ignore_tagger = SyntaxIgnoreTagger()
-        gt_converter         = GTMorphConverter()
+        # =======  Load the run journal
+        journal_fnm = args.journal if args.journal else os.path.join( out_dir, '__journal.jsonl' )
+        journal_records = None
+        if skip_existing and os.path.exists( journal_fnm ):
+            print(' Loading run journal',journal_fnm,'...' )
+            journal_records = load_journal( journal_fnm )
+        journal = open( journal_fnm, 'a', encoding='utf-8' )
+        if journal.tell() > 0:
+            # the last line of a crashed run may be incomplete
+            journal.write('\n')
+        container = None
+        in_container = set()
+        if output_format == 'container':
+            # shards of a subset are named after the file of the subset, so that subsets can be saved into the same folder
+            prefix = os.path.splitext( os.path.basename(in_files) )[0] if in_files else 'shard'
+            container = TextContainerWriter( out_dir, prefix=prefix, shard_size=args.shard_size, compression=args.compression )
+            if skip_existing and journal_records is None:
+                in_container = set( TextContainerReader( out_dir ).doc_ids() )
+        # =======  Collect files that need to be analysed
         startTime = datetime.now() 
-        elapsed = 0
         errors  = 0
         skipped = 0
         processed = 0
         new_files = 0
+        retried = 0
+        tasks = []
+        # input files whose results exist (skipped as completed or analysed in this run)
+        done_inputs = set()
+        def is_done( in_file_name ):
+            if in_file_name in done_inputs:
+                return True
+            record = journal_records.get( in_file_name ) if journal_records is not None else None
+            return record is not None and record['status'] == 'done'
         for in_file_name in all_files:
             fnm  = os.path.join( in_dir, in_file_name )
             # skip dirs and non-input files
-            if os.path.isdir( fnm ):
+            if not packed and os.path.isdir( fnm ):
                 continue
             if not fnm.endswith( input_ext ):
                 continue
@@ -156,91 +720,236 @@ if __name__ == '__main__':
             out_file_name_json = in_file_name.replace(input_ext, '.json')
             ofnm_pckl = os.path.join( out_dir, out_file_name_pckl )
             ofnm_json = os.path.join( out_dir, out_file_name_json )
-            if skip_existing:
+            if journal_records is not None:
+                # the journal is used instead of checking the existence of every output file
+                record = journal_records.get( in_file_name )
+                # a duplicate is completed only if its canonical document still is
+                if record is not None and (record['status'] == 'done' or \
+                   (record['status'] == 'duplicate' and is_done( record['canonical'] ))):
+                    print('(!) Skipping completed file:', record['output'])
+                    done_inputs.add( in_file_name )
+                    processed += 1
+                    skipped += 1
+                    continue
+                if record is not None:
+                    retried += 1
+            elif skip_existing:
+                if in_file_name in in_container:
+                    print('(!) Skipping file in container:', in_file_name)
+                    done_inputs.add( in_file_name )
+                    append_jsonl( journal, { 'input': in_file_name, 'sha1': None, 'output': out_dir, 
+                                               'status': 'done', 'error': None, 'time': str( datetime.now() ) } )
+                    processed += 1
+                    skipped += 1
+                    continue
                 if os.path.exists( ofnm_pckl ):
                     print('(!) Skipping existing file:', ofnm_pckl)
+                    done_inputs.add( in_file_name )
+                    # files from a run without journal are recorded, so that the next run can use the journal
+                    append_jsonl( journal, { 'input': in_file_name, 'sha1': None, 'output': ofnm_pckl, 
+                                               'status': 'done', 'error': None, 'time': str( datetime.now() ) } )
                     processed += 1
                     skipped += 1
                     continue
                 if os.path.exists( ofnm_json ):
                     print('(!) Skipping existing file:', ofnm_json)
+                    done_inputs.add( in_file_name )
+                    # files from a run without journal are recorded, so that the next run can use the journal
+                    append_jsonl( journal, { 'input': in_file_name, 'sha1': None, 'output': ofnm_json, 
+                                               'status': 'done', 'error': None, 'time': str( datetime.now() ) } )
                     processed += 1
                     skipped += 1
                     continue
-            # Load input text from JSON
-            text = json_to_text( file=fnm )
-            # Perform the analysis
-            try:
-                # 0) Add metadata
-                if corpus_type.lower() == 'koond':
-                    text_subcorpus = get_text_subcorpus_name( in_dir, in_file_name )
-                    text.meta['subcorpus'] = str(text_subcorpus)
-
-                # 1) Add basic/tokenization annotations
-                text.tag_layer(['words'])
-                text.tag_layer(['paragraphs'])
-                word_spans = text['words'].spans
-                
-                if output_format == 'pickle':
-                    print(processed,'->',ofnm_pckl)
+            tasks.append( (in_file_name, ofnm_pckl if output_format == 'pickle' else ofnm_json) )
+        if retried > 0:
+            print(' Retrying',retried,'files that failed or were not saved in the previous run.')
+        # =======  Find duplicates (they are not analysed)
+        duplicates = []
+        if args.dedup:
+            print(' Finding duplicates with index',args.dedup,'...' )
+            dedup_start = perf_counter()
+            unique = []
+            found = []
+            with DuplicateIndex( args.dedup, threshold=args.dedup_threshold ) as index:
+                for in_file_name, ofnm in tasks:
+                    data = read_input( in_dir, in_file_name, packed=packed )
+                    raw_text = json.loads( codecs.decode( data, 'utf-8' ) )['text']
+                    duplicate, canonical, canonical_output, similarity = \
+                        index.add( in_file_name, raw_text, output=ofnm if output_format != 'container' else None )
+                    if duplicate is None:
+                        unique.append( (in_file_name, ofnm) )
+                        continue
+                    found.append( ( (in_file_name, ofnm), len( raw_text.split() ), 
+                                    { 'input': in_file_name, 'sha1': hashlib.sha1( data ).hexdigest(), 
+                                      'output': canonical_output, 'status': 'duplicate', 'error': None, 
+                                      'duplicate': duplicate, 'canonical': canonical, 'similarity': similarity } ) )
+            # a duplicate is not analysed if the results of its canonical document exist or the canonical 
+            # document is analysed in this run; otherwise (e.g. the canonical document of an earlier run 
+            # failed and is not in this run) the duplicate is analysed itself
+            analysed_inputs = { in_file_name for in_file_name, ofnm in unique }
+            for task, words, record in found:
+                if is_done( record['canonical'] ) or record['canonical'] in analysed_inputs:
+                    duplicates.append( (task, words, record) )
                 else:
-                    print(processed,'->',ofnm_json)
-
-                # 2) Add morphological analysis
-                resolver = make_resolver(
-                 disambiguate=False,
-                 guess=False,
-                 propername=False,
-                 phonetic=False,
-                 compound=True)
-                text.tag_layer(resolver=resolver)['morph_analysis']
-
-                # 3) Add clauses
-                if add_clauses:
-                    text.tag_layer(['clauses'])
-
-                # 4) Convert morph analyses to GT format 
-                if add_gt_morph_analysis:
-                    gt_converter.tag( text )
-                    
-                # 5) Add syntax_ignore
-                if add_syntax_ignore:
-                    syntax_ignore_tagger.tag( text )
-
-                # 6) Save results
-                if not skip_saving:
-                    if output_format == 'pickle':
-                       with open( ofnm_pckl, 'wb' ) as fout:
-                            pickle.dump(text, fout)
-                    else:
-                       text_to_json(text, file=ofnm_json)
-                    new_files += 1
-
-            # X) Log errors
-            except RuntimeError as err:
-                write_error_log( in_file_name, err )
-                errors += 1
-            except Exception as err:
-                write_error_log( in_file_name, err )
+                    unique.append( task )
+            tasks = unique
+            print(' Found',len(found),'duplicates ({} exact, {} near) in {:.1f} s; they are not analysed.'.format( 
+                  sum( 1 for task, words, record in found if record['duplicate'] == 'exact' ),
+                  sum( 1 for task, words, record in found if record['duplicate'] == 'near' ), perf_counter() - dedup_start ))
+            if len(found) > len(duplicates):
+                print(' ',len(found)-len(duplicates),'of them are analysed anyway, because their canonical documents failed.')
+        if args.order == 'size':
+            # sizes of the files estimate their processing time; the largest files are given to workers first,
+            # and every worker takes the next file when it is free (chunksize=1); only the files that are left 
+            # after the journal (or the existing outputs) and duplicates are skipped are looked up
+            sizes = document_sizes( in_dir, [in_file_name for in_file_name, ofnm in tasks] )
+            tasks.sort( key=lambda task: sizes[task[0]], reverse=True )
+        # =======  Analyse files (in worker processes, if --jobs > 1)
+        metrics_fnm = args.metrics if args.metrics else os.path.join( out_dir, '__metrics.jsonl' )
+        metrics_file = open( metrics_fnm, 'a', encoding='utf-8' )
+        progress = ProgressMeter( len(tasks) )
+        last_report = perf_counter()
+        stage_totals = {}
+        slowest = []   # heap of (seconds, input file, words) of the slowest documents
+        worker_time = defaultdict(float)
+        worker_documents = defaultdict(int)
+        plan, target_layers = layer_plan( args.target )
+        print(' Layers to be made:', ', '.join( layer for stage, layer in plan ), 
+              '(only these are saved)' if args.drop_intermediate else '')
+        process_task = partial( process_file, in_dir, corpus_type, output_format, packed=packed, 
+                                plan=plan, keep=target_layers if args.drop_intermediate else None )
+        max_memory = args.max_memory * 2**20 if args.max_memory is not None else None
+        workers = None
+        pool = None
+        if args.timeout is not None or max_memory is not None:
+            print(' Analysing',len(tasks),'files with',args.jobs,'supervised worker process(es).')
+            workers = SupervisedWorkers( args.jobs, process_task, timeout=args.timeout, max_memory=max_memory )
+            results = workers.run( tasks )
+        elif args.jobs > 1:
+            print(' Analysing',len(tasks),'files with',args.jobs,'worker processes.')
+            pool = Pool( args.jobs, initializer=init_taggers )
+            results = pool.imap_unordered( process_task, tasks, chunksize=1 )
+        else:
+            init_taggers()
+            results = map( process_task, tasks )
+        quarantine_file = open( os.path.join( out_dir, '__quarantine.jsonl' ), 'a', encoding='utf-8' )
+        quarantined = []
+        def retry_quarantined():
+            # files that were quarantined are analysed again with larger limits, after all other files
+            if workers is not None:
+                workers.close()
+            if not quarantined or args.retry_factor <= 0:
+                return
+            print()
+            print(' Retrying',len(quarantined),'quarantined files with',args.retry_factor,'times larger limits.')
+            retry_workers = SupervisedWorkers( min( args.jobs, len(quarantined) ), process_task, 
+                                               timeout=args.timeout * args.retry_factor if args.timeout is not None else None,
+                                               max_memory=max_memory * args.retry_factor if max_memory is not None else None )
+            for record in retry_workers.run( quarantined ):
+                record['retry'] = True
+                yield record
+            retry_workers.close()
+        in_shard = []
+        for record in chain( results, retry_quarantined() ):
+            record['time'] = str( datetime.now() )
+            metrics = record.pop( 'metrics' )
+            retry = record.pop( 'retry', False )
+            text_dict = record.pop( 'text_dict', None )
+            if text_dict is not None:
+                record['output'] = container.current_shard()
+                # documents of a shard are recorded in the journal when the shard is closed
+                in_shard.append( record )
+                if container.add( record['input'], text_dict ):
+                    for shard_record in in_shard:
+                        append_jsonl( journal, shard_record )
+                    in_shard = []
+            else:
+                append_jsonl( journal, record )
+            print('retry' if retry else processed,'->',record['output'])
+            if record['status'] == 'quarantined':
+                print('(!) Quarantined:', record['input'], '--', record['error'])
+                append_jsonl( quarantine_file, { 'input': record['input'], 'reason': record['reason'], 'stage': record['stage'],
+                                                 'seconds': metrics['seconds'], 'retry': retry, 'time': record['time'] } )
+                if not retry and args.retry_factor > 0:
+                    quarantined.append( (record['input'], record['output']) )
+            # Log errors (quarantined files are logged if they fail again on retry)
+            if record['status'] == 'error' or \
+               (record['status'] == 'quarantined' and (retry or args.retry_factor <= 0)):
+                write_error_log( record['input'], record['error'] )
                 errors += 1
-            processed += 1
-
-            # Report processing status and time elapsed
-            if processed % 500 == 0:
-                print(processed)
-            time_diff = datetime.now() - startTime 
-            minutes = time_diff / timedelta(minutes=1)
-            seconds = time_diff / timedelta(seconds=1)
-            if (2 <= int(minutes) < 3 and elapsed == 0) or \
-               (5 <= int(minutes) < 6 and elapsed == 1) or \
-               (7 <= int(minutes) < 8 and elapsed == 2) or \
-               (10 <= int(minutes) < 11 and elapsed == 3) or \
-               (15 <= int(minutes) < 16 and elapsed == 4) or \
-               (30 <= int(minutes) < 31 and elapsed == 5):
+            if record['status'] == 'done':
+                new_files += 1
+                done_inputs.add( record['input'] )
+            if not retry:
+                processed += 1
+
+            # Record metrics of the document
+            append_jsonl( metrics_file, dict( type='document', input=record['input'], status=record['status'], **metrics ) )
+            if not retry:
+                progress.add( metrics['words'] )
+            for stage, seconds in metrics['stages'].items():
+                stage_totals[stage] = stage_totals.get( stage, 0.0 ) + seconds
+            worker_time[metrics['worker']] += metrics['seconds']
+            worker_documents[metrics['worker']] += 1
+            heapq.heappush( slowest, (metrics['seconds'], record['input'], metrics['words']) )
+            if len( slowest ) > args.slowest:
+                heapq.heappop( slowest )
+
+            # Report processing status, rates and ETA
+            if perf_counter() - last_report >= args.report_every:
+                last_report = perf_counter()
+                report = progress.report()
+                append_jsonl( metrics_file, report )
                 print()
-                print('Time elapsed (hh:mm:ss.ms) {}'.format(time_diff))
+                print('Time elapsed (hh:mm:ss.ms) {}'.format(datetime.now() - startTime))
+                print(' {} / {} files, {:.2f} docs/sec, {:.0f} words/sec, ETA {}'.format( report['documents'], 
+                      report['total'], report['docs_per_sec'], report['words_per_sec'], 
+                      timedelta( seconds=int(report['eta']) ) if report['eta'] is not None else '?' ))
                 print()
-                elapsed += 1
+        if pool is not None:
+            pool.close()
+            pool.join()
+        quarantine_file.close()
+        if container is not None:
+            container.close()
+            for shard_record in in_shard:
+                append_jsonl( journal, shard_record )
+        # duplicates are recorded after the analysis, only if their canonical documents are done; the other 
+        # duplicates are not recorded, so that they are found again (and checked again) by the next run
+        linked = 0
+        duplicate_words = 0
+        pending_duplicates = 0
+        for (in_file_name, ofnm), words, record in duplicates:
+            if not is_done( record['canonical'] ):
+                pending_duplicates += 1
+                continue
+            duplicate_words += words
+            if args.duplicates == 'link' and record['output'] is not None and \
+               os.path.exists( record['output'] ) and not os.path.exists( ofnm ):
+                try:
+                    os.link( record['output'], ofnm )
+                    record['output'] = ofnm
+                    linked += 1
+                except OSError:
+                    # e.g. the output of an earlier run is on another file system: the record refers to it
+                    pass
+            record['time'] = str( datetime.now() )
+            append_jsonl( journal, record )
+        journal.close()
+        slowest = sorted( slowest, reverse=True )
+        summary = progress.report()
+        # utilisation of a worker: the part of the time of the analysis when the worker was busy with a file
+        worker_stats = { worker: { 'documents': worker_documents[worker], 'busy': round(seconds, 3), 
+                                   'utilisation': round(seconds / summary['elapsed'], 3) if summary['elapsed'] > 0 else None }
+                         for worker, seconds in sorted( worker_time.items() ) }
+        summary.update( type='summary', stages={ stage: round(seconds, 3) for stage, seconds in stage_totals.items() },
+                        slowest=[ {'input': fnm, 'seconds': seconds, 'words': words} for seconds, fnm, words in slowest ],
+                        workers=worker_stats )
+        if args.dedup:
+            summary['duplicates'] = { 'documents': len( duplicates ) - pending_duplicates, 'words': duplicate_words, 
+                                      'linked': linked, 'pending': pending_duplicates }
+        append_jsonl( metrics_file, summary )
+        metrics_file.close()
         print()
 
         # Report final statistics about processing
@@ -249,6 +958,26 @@ if __name__ == '__main__':
         print(' ',errors,'processing errors.')
         print(' ',processed,'files processed (incl',skipped,'files skipped).')
         print(' ',new_files,'new files created.')
+        if args.dedup:
+            print(' ',len(duplicates) - pending_duplicates,'duplicates not analysed (about',duplicate_words,'words saved;',linked,'linked).')
+            if pending_duplicates:
+                print(' ',pending_duplicates,'duplicates left pending, because their canonical documents failed.')
+        if quarantined:
+            print(' ',len(quarantined),'files quarantined (see __quarantine.jsonl in',out_dir,').')
+        if stage_totals:
+            print('  Time of stages (sum over documents):')
+            for stage, seconds in stage_totals.items():
+                print('    {:<16} {}'.format(stage, timedelta(seconds=seconds)))
+        if len( worker_stats ) > 1:
+            print('  Utilisation of workers:')
+            for worker, statistics in worker_stats.items():
+                print('    process {}: {} files, busy {}, utilisation {:.0%}'.format(worker, statistics['documents'], 
+                      timedelta(seconds=statistics['busy']), statistics['utilisation'] or 0.0))
+        if slowest:
+            print('  Slowest documents:')
+            for seconds, fnm, words in slowest:
+                print('    {:.2f} s  {} words  {}'.format(seconds, words, fnm))
+        print('  Metrics saved to',metrics_fnm)
         time_diff = datetime.now() - startTime
         print(' Total processing time: {}'.format(time_diff))
     else:
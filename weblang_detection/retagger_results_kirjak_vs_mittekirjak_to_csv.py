@@ -4,37 +4,43 @@ from estnltk import Text
 import os
 from paragraphweblanguagescoreretagger import ParagraphWebLanguageScoreRetagger
 from estnltk.converters import json_to_text
+from packed_corpus import iter_documents
 import csv
 from collections import defaultdict
 
 cwd = os.getcwd()
-path = os.path.join(cwd, "kirjak_vs_mittekirjak_ettenten_tagged") 
+path = os.path.join(cwd, "kirjak_vs_mittekirjak_ettenten_tagged") # folder of json-files or a packed corpus (pack_corpus.py)
 
-weblang_tagger=ParagraphWebLanguageScoreRetagger(use_punct_reps=True)
+profile = False # True - prints wall time, calls and counted spans of every detector of the retagger after tagging
+
+weblang_tagger=ParagraphWebLanguageScoreRetagger(use_punct_reps=True, instrument=profile)
 
 info_all=[] # all texts and their total scores of features 
 
-for file in os.listdir(path):
+for file, json_text in iter_documents(path):
     file_location = os.path.join(path, file)
     if "json" in file_location:
         info_files=defaultdict(list) # scores of features of paragraphs
         filename=file_location.split("\\")[-1]
         info_files["filename"]=[filename]
-        text = json_to_text(file=file_location)
-        weblang_tagger.retag(text)
+        text = json_to_text(json_text)
+        features=weblang_tagger.paragraph_features(text) # paragraphs x features matrix
         
         if "mittekirjak" in filename:
             info_files["doc_category"].append("mittekirjak")
         else:
             info_files["doc_category"].append("kirjak")
             
-        for i in text.paragraphs.attributes:
-            info_files[i].append(sum(text.paragraphs[i]))
+        for i, total in zip(features.attributes, features.totals()):
+            info_files[i].append(int(total))
         info_all.append(info_files)
+
+if profile:
+    print(weblang_tagger.detector_report())
         
 with open ("weblang_scores.csv","w") as csvfile:
     fieldnames=['filename', "doc_category"]
-    for i in text.paragraphs.attributes:
+    for i in weblang_tagger.output_attributes:
         fieldnames.append(i)
     writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
     writer.writeheader()
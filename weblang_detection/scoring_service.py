@@ -0,0 +1,271 @@
+# Local scoring service for web language detection (and normalization).
+# Keeps ParagraphWebLanguageScoreRetagger and NormalizeWordsRetagger (with Vabamorf and the Java-based ClauseSegmenter) warm,
+# so that texts can be scored without the startup cost of a new script.
+# Concurrent requests are collected into micro-batches (up to --max_batch_size texts, waiting at most --max_wait_ms
+# milliseconds for more texts), and every batch is scored with one ParagraphWebLanguageScoreRetagger.retag_many call.
+# Normalization requests are not batched: NormalizeWordsRetagger has no batch form (it looks at the neighbouring
+# words, so texts can not be joined into one Text), and waiting for more texts would only add latency.
+#
+# Listens on localhost (--host, --port) or on a Unix socket (--socket). HTTP endpoints:
+#   POST /score      -- body {"text": "..."} or {"texts": ["...", ...]}; returns whole_text_score and paragraph scores
+#   POST /normalize  -- body {"text": "..."} or {"texts": ["...", ...]}; returns normalized forms of words
+#   GET  /stats      -- numbers of requests and batches (calls of the tagger), queue depth and latency percentiles (ms) of both endpoints
+#   GET  /health
+
+import os
+import sys
+import json
+import asyncio
+import argparse
+from time import perf_counter
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from estnltk import Text
+from estnltk.resolve_layer_dag import make_resolver
+from paragraphweblanguagescoreretagger import ParagraphWebLanguageScoreRetagger
+from process_and_save_results import morph_analysis_settings
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'weblang_normalization'))
+from NormalizeWordsRetagger import NormalizeWordsRetagger
+
+
+HTTP_STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+
+class LatencyStatistics:
+    """Numbers of requests and batches, and latencies of the last window requests of an endpoint."""
+
+    def __init__(self, window=10000):
+        self.latencies=deque(maxlen=window)
+        self.requests=0
+        self.texts=0
+        self.batches=0
+
+    def add_request(self, texts, latency):
+        self.requests+=1
+        self.texts+=texts
+        self.latencies.append(latency)
+
+    def add_batch(self):
+        self.batches+=1
+
+    def percentiles(self, percents=(50, 90, 99)):
+        """Returns latency percentiles in milliseconds (nearest-rank method)."""
+        latencies=sorted(self.latencies)
+        if not latencies:
+            return {'p{}'.format(p): None for p in percents}
+        return {'p{}'.format(p): 1000*latencies[min(len(latencies)-1, max(0, -(-p*len(latencies)//100)-1))] for p in percents}
+
+    def report(self, queue_depth):
+        return {'requests': self.requests,
+                'texts': self.texts,
+                'batches': self.batches,
+                'mean_batch_size': self.texts/self.batches if self.batches else None,
+                'queue_depth': queue_depth,
+                'latency_ms': self.percentiles()}
+
+
+class ScoringService:
+    """Warm taggers and micro-batching queues of the scoring service."""
+
+    def __init__(self, max_batch_size=32, max_wait=0.01, normalize=True):
+        self.max_batch_size=max_batch_size
+        self.max_wait=max_wait
+        self.resolver=make_resolver(**morph_analysis_settings)
+        self.weblang_tagger=ParagraphWebLanguageScoreRetagger()
+        self.normalizer=NormalizeWordsRetagger() if normalize else None
+        # taggers are not thread-safe, so all batches are processed one after another in one worker thread
+        self.executor=ThreadPoolExecutor(max_workers=1)
+        # endpoints with micro-batching (see batcher); /normalize is processed one request at a time (see normalize)
+        self.process_batch={'score': self.score_batch}
+        # queues are made in serve, in the event loop that uses them
+        self.queues={}
+        self.statistics={kind: LatencyStatistics() for kind in ('score', 'normalize')}
+
+    def _prepare(self, t):
+        """Makes a Text with the layers needed for scoring (the same layers as process_and_save_results.py adds)."""
+        text=Text(t)
+        text.tag_layer(['words'])
+        text.tag_layer(['paragraphs'])
+        text.tag_layer(resolver=self.resolver)['morph_analysis']
+        text.meta['morph_analysis_settings'] = dict(morph_analysis_settings)
+        text.tag_layer(['clauses'], resolver=self.resolver)
+        return text
+
+    def score_batch(self, texts):
+        texts=[self._prepare(t) for t in texts]
+        self.weblang_tagger.retag_many(texts, batch_size=len(texts))
+        results=[]
+        for text in texts:
+            columns=[list(text.paragraphs[attr]) for attr in self.weblang_tagger.output_attributes]
+            paragraphs=[dict(zip(self.weblang_tagger.output_attributes, values), start=parag.start, end=parag.end)
+                        for parag, values in zip(text.paragraphs, zip(*columns))]
+            results.append({'whole_text_score': text.meta['whole_text_score'], 'paragraphs': paragraphs})
+        return results
+
+    def normalize(self, texts):
+        results=[]
+        for t in texts:
+            text=Text(t)
+            text.tag_layer(['words'])
+            self.normalizer.retag(text)
+            results.append({'words': [{'start': w.start, 'end': w.end, 'text': w.text, 'normalized_form': list(w.normalized_form)}
+                                      for w in text.words if any(form is not None for form in w.normalized_form)]})
+        return results
+
+    def warm_up(self):
+        """Scores a short text, so that the Java processes are started before the first request."""
+        self.score_batch(["Tere!\n\nKuidas läheb, kas kõik on hästi"])
+        if self.normalizer is not None:
+            self.normalize(["Tereeee"])
+
+    async def submit(self, kind, texts):
+        """Puts texts into the queue of kind ('score') and waits for their results. 
+           Texts of kind 'normalize' are normalized right away in the worker thread."""
+        loop=asyncio.get_running_loop()
+        start=perf_counter()
+        if kind in self.process_batch:
+            futures=[loop.create_future() for t in texts]
+            for t, future in zip(texts, futures):
+                self.queues[kind].put_nowait((t, future))
+            results=await asyncio.gather(*futures)
+        else:
+            self.statistics[kind].add_batch()
+            results=await loop.run_in_executor(self.executor, self.normalize, texts)
+        self.statistics[kind].add_request(len(texts), perf_counter()-start)
+        return results
+
+    async def batcher(self, kind):
+        """Collects texts from the queue into batches and processes every batch in the worker thread."""
+        loop=asyncio.get_running_loop()
+        queue=self.queues[kind]
+        while True:
+            batch=[await queue.get()]
+            deadline=loop.time()+self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout=deadline-loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.statistics[kind].add_batch()
+            try:
+                results=await loop.run_in_executor(self.executor, self.process_batch[kind], [t for t, future in batch])
+            except Exception:
+                # a text that can not be processed should not fail the other requests of the batch
+                results=None
+            for i, (t, future) in enumerate(batch):
+                if results is None:
+                    try:
+                        result=(await loop.run_in_executor(self.executor, self.process_batch[kind], [t]))[0]
+                    except Exception as err:
+                        if not future.done():
+                            future.set_exception(err)
+                        continue
+                else:
+                    result=results[i]
+                if not future.done():
+                    future.set_result(result)
+
+    async def serve(self, host='127.0.0.1', port=8080, socket=None):
+        """Starts the batchers and listens on the host and port (or on the Unix socket) until cancelled."""
+        self.queues={kind: asyncio.Queue() for kind in self.process_batch}
+        batchers=[asyncio.ensure_future(self.batcher(kind)) for kind in self.process_batch]
+        if socket:
+            server=await asyncio.start_unix_server(self.handle_connection, path=socket)
+            print(' Listening on', socket)
+        else:
+            server=await asyncio.start_server(self.handle_connection, host=host, port=port)
+            print(' Listening on http://{}:{}'.format(host, port))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for batcher in batchers:
+                batcher.cancel()
+
+    def stats(self):
+        return {kind: statistics.report(self.queues[kind].qsize() if kind in self.queues else 0) 
+                for kind, statistics in self.statistics.items()}
+
+    async def route(self, method, path, body):
+        """Returns HTTP status and response of a request."""
+        if method == 'GET' and path == '/health':
+            return 200, {'status': 'ok'}
+        if method == 'GET' and path == '/stats':
+            return 200, self.stats()
+        if method == 'POST' and path in ('/score', '/normalize'):
+            kind=path[1:]
+            if kind == 'normalize' and self.normalizer is None:
+                return 503, {'error': 'normalization is switched off'}
+            try:
+                request=json.loads(body.decode('utf-8'))
+                texts=[request['text']] if 'text' in request else request['texts']
+                if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                    raise ValueError('texts should be a list of strings')
+            except (ValueError, KeyError, TypeError, AttributeError) as err:
+                return 400, {'error': 'expected {"text": "..."} or {"texts": [...]}: ' + str(err)}
+            try:
+                results=await self.submit(kind, texts)
+            except Exception as err:
+                return 500, {'error': str(err)}
+            return 200, results[0] if 'text' in request else {'results': results}
+        return 404, {'error': 'unknown endpoint: {} {}'.format(method, path)}
+
+    async def handle_connection(self, reader, writer):
+        """Reads HTTP/1.1 requests from a connection (keep-alive is supported) and writes JSON responses."""
+        try:
+            while True:
+                request_line=await reader.readline()
+                if not request_line:
+                    break
+                headers={}
+                while True:
+                    line=await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value=line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()]=value.strip()
+                try:
+                    method, path, version=request_line.decode('latin-1').split()
+                    body=await reader.readexactly(int(headers.get('content-length', 0)))
+                    status, response=await self.route(method, path.split('?')[0], body)
+                except ValueError:
+                    version='HTTP/1.0'
+                    status, response=400, {'error': 'malformed request'}
+                payload=json.dumps(response, ensure_ascii=False).encode('utf-8')
+                writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json; charset=utf-8\r\nContent-Length: {}\r\n\r\n'.format(
+                             status, HTTP_STATUS[status], len(payload)).encode('latin-1') + payload)
+                await writer.drain()
+                if version == 'HTTP/1.0' or headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Local scoring service with warm web language taggers.')
+    arg_parser.add_argument('--host', default='127.0.0.1', help='host to listen on')
+    arg_parser.add_argument('--port', type=int, default=8080, help='port to listen on')
+    arg_parser.add_argument('--socket', default=None, help='listens on this Unix socket instead of the host and port')
+    arg_parser.add_argument('--max_batch_size', type=int, default=32, help='largest number of texts in a batch')
+    arg_parser.add_argument('--max_wait_ms', type=float, default=10, help='how long a batch waits for more texts (milliseconds)')
+    arg_parser.add_argument('--no_normalize', default=False, action='store_true', help='does not load NormalizeWordsRetagger')
+    args = arg_parser.parse_args()
+
+    startTime=perf_counter()
+    service=ScoringService(max_batch_size=args.max_batch_size, max_wait=args.max_wait_ms/1000, normalize=not args.no_normalize)
+    service.warm_up()
+    print(' Taggers loaded in {:.1f} s'.format(perf_counter()-startTime))
+
+    try:
+        asyncio.run(service.serve(host=args.host, port=args.port, socket=args.socket))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
@@ -0,0 +1,36 @@
+# Splits the json-files of a folder (or the documents of a packed corpus) into subsets of about equal total size,
+# for running process_and_save_results.py on different machines with --in_files.
+# Files are assigned largest first, every file to the subset with the smallest total size so far, so that one
+# subset does not get most of the large files. Every subset is listed largest file first.
+
+import os
+import argparse
+from packed_corpus import is_packed_corpus, PackedCorpus, document_sizes
+
+
+arg_parser = argparse.ArgumentParser(description='Splits input files into subsets of equal total size.')
+arg_parser.add_argument('in_dir', help='folder of json-files or a packed corpus')
+arg_parser.add_argument('subsets', type=int, help='number of subsets')
+arg_parser.add_argument('--out_prefix', default='subset', help='subsets are written into files <out_prefix>_1.txt, <out_prefix>_2.txt, ...')
+args = arg_parser.parse_args()
+
+if is_packed_corpus(args.in_dir):
+    with PackedCorpus(args.in_dir) as corpus:
+        names=corpus.doc_ids()
+else:
+    names=[name for name in os.listdir(args.in_dir) if name.endswith('.json')]
+sizes=document_sizes(args.in_dir, names)
+
+subsets=[[] for i in range(args.subsets)]
+totals=[0]*args.subsets
+for name in sorted(names, key=lambda name: sizes[name], reverse=True):
+    i=totals.index(min(totals))
+    subsets[i].append(name)
+    totals[i]+=sizes[name]
+
+for i, (subset, total) in enumerate(zip(subsets, totals)):
+    fnm='{}_{}.txt'.format(args.out_prefix, i+1)
+    with open(fnm, 'w', encoding='utf-8') as f:
+        for name in subset:
+            f.write(name+'\n')
+    print('{}: {} files, {:.1f} MB'.format(fnm, len(subset), total/2**20))
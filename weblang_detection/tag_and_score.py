@@ -0,0 +1,123 @@
+# Tags the json-files of a folder (or the documents of a packed corpus) and scores them with
+# ParagraphWebLanguageScoreRetagger in one pass: raw input -> layers -> web language features -> csv row.
+# Does the same as process_and_save_results.py --target weblang followed by retagger_results_kirjak_vs_mittekirjak_to_csv.py,
+# but the tagged texts are not written to disk and parsed again; a text is kept in memory only until its row is made.
+# Tagged texts can still be saved with --save_dir (as json-files, like the output of process_and_save_results.py).
+# With a paragraph cache (--cache_size, --cache_file; see paragraph_cache.py) paragraphs repeated across pages of a domain
+# are scored once; a document whose paragraphs are all in the cache is not analysed further than paragraphs.
+
+import os
+import csv
+import codecs
+import argparse
+from time import perf_counter
+from functools import partial
+from multiprocessing import Pool
+from estnltk.converters import json_to_text
+from packed_corpus import PackedCorpus, is_packed_corpus, document_sizes
+from paragraph_cache import ParagraphCache, HitStatistics, domain_of
+from paragraphweblanguagescoreretagger import ParagraphWebLanguageScoreRetagger
+from process_and_save_results import layer_plan, add_layers, read_input, save_text, write_error_log
+
+
+# retagger of the current process (every worker process makes its own)
+weblang_taggers={}
+
+def score_file(in_dir, save_dir, file, packed=False, cache_size=None, cache_file=None):
+    """Tags and scores one document. Returns (file, row, words, paragraphs, cached, error): row is None if the document 
+       failed; cached is the number of paragraphs answered from the paragraph cache."""
+    try:
+        if 'weblang_tagger' not in weblang_taggers:
+            cache=None
+            if cache_size is not None or cache_file is not None:
+                cache=ParagraphCache(max_size=cache_size or 100000, path=cache_file)
+            weblang_taggers['weblang_tagger']=ParagraphWebLanguageScoreRetagger(use_punct_reps=True, cache=cache)
+        weblang_tagger=weblang_taggers['weblang_tagger']
+        text=json_to_text(codecs.decode(read_input(in_dir, file, packed=packed), 'utf-8'))
+        if weblang_tagger.cache is not None and save_dir is None:
+            # morph analysis and clauses are only needed for paragraphs that are not in the cache
+            add_layers(text, layer_plan(['paragraphs'])[0])
+            if not weblang_tagger.cached(text):
+                add_layers(text, layer_plan(['weblang'])[0])
+        else:
+            add_layers(text, layer_plan(['weblang'])[0])
+        if save_dir is not None:
+            save_text(text, os.path.join(save_dir, file), 'json')
+        features=weblang_tagger.paragraph_features(text, domain=domain_of(file))
+        row={'filename': file, 'doc_category': "mittekirjak" if "mittekirjak" in file else "kirjak"}
+        for attribute, total in zip(features.attributes, features.totals()):
+            row[attribute]=int(total)
+        return file, row, len(text.words), len(features.matrix), features.meta.get('cached_paragraphs', 0), None
+    except Exception as err:
+        return file, None, 0, 0, 0, '{}: {}'.format(type(err).__name__, err)
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Tags documents and writes their web language feature totals into a csv-file.')
+    arg_parser.add_argument('in_dir', help='folder of json-files that are not tagged, or a packed corpus of them')
+    arg_parser.add_argument('--in_files', default=None, help='a text file containing names of the files that should be processed')
+    arg_parser.add_argument('--out_csv', default='weblang_scores.csv', help='csv-file of the feature totals of every document')
+    arg_parser.add_argument('--save_dir', default=None, help='folder where the tagged texts are also saved as json-files (by default they are not saved)')
+    arg_parser.add_argument('--jobs', type=int, default=1, help='number of worker processes')
+    arg_parser.add_argument('--cache_size', type=int, default=None,
+                            help='use a paragraph cache that keeps this many paragraphs in memory (in every worker process)')
+    arg_parser.add_argument('--cache_file', default=None,
+                            help='SQLite file of the paragraph cache, shared by the worker processes and kept for later runs')
+    arg_parser.add_argument('--domains', type=int, default=20, help='number of domains in the table of hit rates of the cache')
+    args = arg_parser.parse_args()
+
+    packed=is_packed_corpus(args.in_dir)
+    if args.in_files:
+        with open(args.in_files, 'r', encoding='utf-8') as f:
+            files=[line.strip() for line in f if line.strip()]
+    elif packed:
+        with PackedCorpus(args.in_dir) as corpus:
+            files=corpus.doc_ids()
+    else:
+        files=[file for file in os.listdir(args.in_dir) if file.endswith('.json')]
+    # largest documents first, so that a large document does not leave one worker running alone at the end
+    sizes=document_sizes(args.in_dir, files)
+    files.sort(key=lambda file: sizes[file], reverse=True)
+    if args.save_dir is not None:
+        os.makedirs(args.save_dir, exist_ok=True)
+
+    start=perf_counter()
+    process_task=partial(score_file, args.in_dir, args.save_dir, packed=packed, cache_size=args.cache_size, cache_file=args.cache_file)
+    pool=Pool(args.jobs) if args.jobs > 1 else None
+    results=pool.imap_unordered(process_task, files, chunksize=1) if pool is not None else map(process_task, files)
+    rows={}
+    words=0
+    failed=0
+    # hits of the paragraph caches of all worker processes
+    hit_statistics=HitStatistics()
+    try:
+        for i, (file, row, file_words, paragraphs, cached, error) in enumerate(results):
+            if error is not None:
+                failed+=1
+                write_error_log(file, error)
+            else:
+                rows[file]=row
+                words+=file_words
+                hit_statistics.count(domain_of(file), cached, paragraphs-cached)
+            if (i+1) % 1000 == 0:
+                print(i+1,'of',len(files),'documents scored')
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    fieldnames=['filename', 'doc_category']+list(ParagraphWebLanguageScoreRetagger(use_punct_reps=True).output_attributes)
+    with open(args.out_csv, 'w', encoding='utf-8', newline='') as csvfile:
+        writer=csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=';')
+        writer.writeheader()
+        for file in sorted(rows):
+            writer.writerow(rows[file])
+
+    elapsed=perf_counter()-start
+    print("Scored",len(rows),"documents ({} words) in {:.1f} s, {:.0f} words/sec".format(words, elapsed, words/elapsed if elapsed > 0 else 0))
+    if failed:
+        print(failed,"documents failed, see __errors.txt")
+    if args.cache_size is not None or args.cache_file is not None:
+        print()
+        print("Hit rates of the paragraph cache:")
+        print(hit_statistics.report(args.domains))
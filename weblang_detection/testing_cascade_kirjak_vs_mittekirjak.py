@@ -0,0 +1,57 @@
+# This script is for testing purposes.
+# Compares the cascade mode of paragraphweblanguagescoreretagger with full scoring on files from folder "kirjak_vs_mittekirjak_ettenten_tagged".
+# In cascade mode unknown words and missing commas are only counted if the score of the other attributes is close to the threshold.
+# Reports how many files skipped each expensive detector, the time of both modes and how the labels differ.
+
+import os
+import argparse
+from time import perf_counter
+from estnltk.converters import json_to_text
+from paragraphweblanguagescoreretagger import ParagraphWebLanguageScoreRetagger
+
+
+arg_parser = argparse.ArgumentParser(description='Compares the cascade mode of paragraphweblanguagescoreretagger with full scoring.')
+arg_parser.add_argument('--in_dir', default='kirjak_vs_mittekirjak_ettenten_tagged',
+                        help='folder of tagged json-files (output of process_and_save_results.py)')
+arg_parser.add_argument('--threshold', type=float, default=0.04, help='files with a score above threshold are labelled as "mittekirjak"')
+arg_parser.add_argument('--band', type=float, default=0.04, help='uncertainty band below the threshold')
+args = arg_parser.parse_args()
+
+full_tagger=ParagraphWebLanguageScoreRetagger()
+cascade_tagger=ParagraphWebLanguageScoreRetagger(cascade_threshold=args.threshold, cascade_band=args.band)
+
+def label(text):
+    return "mittekirjak" if text.meta["whole_text_score"] > args.threshold else "kirjak"
+
+files=[file for file in sorted(os.listdir(args.in_dir)) if file.endswith(".json")]
+full_time=0
+cascade_time=0
+different_labels=[]
+correct={"full": 0, "cascade": 0}
+
+for file in files:
+    labels={}
+    for mode, tagger in (("full", full_tagger), ("cascade", cascade_tagger)):
+        text = json_to_text(file=os.path.join(args.in_dir, file))
+        start=perf_counter()
+        tagger.retag(text)
+        elapsed=perf_counter()-start
+        if mode == "full":
+            full_time+=elapsed
+        else:
+            cascade_time+=elapsed
+        labels[mode]=label(text)
+        if file.startswith(labels[mode]+"__"): # true category is the beginning of the file name
+            correct[mode]+=1
+    if labels["full"] != labels["cascade"]:
+        different_labels.append((file, labels["full"], labels["cascade"]))
+
+print("Threshold:",args.threshold,"band:",args.band)
+print("Files:",cascade_tagger.cascade_statistics["texts"])
+print("Skipped unknown words:",cascade_tagger.cascade_statistics["skipped_unknown_words"])
+print("Skipped missing commas:",cascade_tagger.cascade_statistics["skipped_missing_commas"])
+print("Time: full {:.2f} s, cascade {:.2f} s".format(full_time, cascade_time))
+print("Correct labels: full {}, cascade {} (of {})".format(correct["full"], correct["cascade"], len(files)))
+print("Different labels:",len(different_labels))
+for file, full_label, cascade_label in different_labels:
+    print("  ",file,"full:",full_label,"cascade:",cascade_label)
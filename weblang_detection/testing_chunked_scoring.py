@@ -0,0 +1,53 @@
+# This script is for testing purposes.
+# Checks that the chunked mode of paragraphweblanguagescoreretagger gives the same results as scoring whole texts,
+# on files from folder "kirjak_vs_mittekirjak_ettenten_tagged", and compares peak memory of retagging in both modes.
+
+import os
+import argparse
+import tracemalloc
+from estnltk.converters import json_to_text
+from paragraphweblanguagescoreretagger import ParagraphWebLanguageScoreRetagger
+
+
+arg_parser = argparse.ArgumentParser(description='Compares the chunked mode of paragraphweblanguagescoreretagger with scoring whole texts.')
+arg_parser.add_argument('--in_dir', default='kirjak_vs_mittekirjak_ettenten_tagged',
+                        help='folder of tagged json-files (output of process_and_save_results.py)')
+arg_parser.add_argument('--chunk_size', type=int, default=10, help='number of paragraphs in a chunk')
+args = arg_parser.parse_args()
+
+full_tagger=ParagraphWebLanguageScoreRetagger()
+chunked_tagger=ParagraphWebLanguageScoreRetagger(chunk_size=args.chunk_size)
+
+def retag(tagger, file):
+    """Returns the retagged text and the peak memory (bytes) allocated during retagging."""
+    text = json_to_text(file=file)
+    tracemalloc.start()
+    tagger.retag(text)
+    peak=tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return text, peak
+
+mismatches=0
+largest_peak={"full": 0, "chunked": 0}
+files=[file for file in sorted(os.listdir(args.in_dir)) if file.endswith(".json")]
+
+for file in files:
+    full_text, full_peak=retag(full_tagger, os.path.join(args.in_dir, file))
+    chunked_text, chunked_peak=retag(chunked_tagger, os.path.join(args.in_dir, file))
+    largest_peak["full"]=max(largest_peak["full"], full_peak)
+    largest_peak["chunked"]=max(largest_peak["chunked"], chunked_peak)
+
+    for attr in full_tagger.output_attributes:
+        if list(full_text.paragraphs[attr]) != list(chunked_text.paragraphs[attr]):
+            print("Paragraph scores differ:",file,attr)
+            mismatches+=1
+    if full_text.meta["whole_text_score"] != chunked_text.meta["whole_text_score"]:
+        print("Whole text score differs:",file,full_text.meta["whole_text_score"],"!=",chunked_text.meta["whole_text_score"])
+        mismatches+=1
+    print(file,"peak memory: full {:.1f} MB, chunked {:.1f} MB".format(full_peak/2**20, chunked_peak/2**20))
+
+print("Chunk size:",args.chunk_size)
+print("Largest peak memory: full {:.1f} MB, chunked {:.1f} MB".format(largest_peak["full"]/2**20, largest_peak["chunked"]/2**20))
+print(len(files),"files checked,",mismatches,"differences found.")
+if mismatches != 0:
+    raise SystemExit(1)
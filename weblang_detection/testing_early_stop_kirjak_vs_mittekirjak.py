@@ -0,0 +1,64 @@
+# This script is for testing purposes.
+# Compares the early-stop mode of paragraphweblanguagescoreretagger with full scoring on files from folder "kirjak_vs_mittekirjak_ettenten_tagged".
+# In early-stop mode unknown words and missing commas are counted a few paragraphs at a time, until the label of the file can not change.
+# Reports how many files stopped early, how many paragraphs were used, the time of both modes and how the labels differ.
+
+import os
+import argparse
+from time import perf_counter
+from estnltk.converters import json_to_text
+from paragraphweblanguagescoreretagger import ParagraphWebLanguageScoreRetagger
+
+
+arg_parser = argparse.ArgumentParser(description='Compares the early-stop mode of paragraphweblanguagescoreretagger with full scoring.')
+arg_parser.add_argument('--in_dir', default='kirjak_vs_mittekirjak_ettenten_tagged',
+                        help='folder of tagged json-files (output of process_and_save_results.py)')
+arg_parser.add_argument('--threshold', type=float, default=0.04, help='files with a score above threshold are labelled as "mittekirjak"')
+arg_parser.add_argument('--window', type=int, default=5, help='number of paragraphs processed at a time')
+arg_parser.add_argument('--z', type=float, default=None,
+                        help='the label is also decided if the estimated score is z standard errors away from the threshold '
+                             '(by default, only stops if the label can not change)')
+arg_parser.add_argument('--min_words', type=int, default=200, help='minimum number of words used before the test with --z')
+args = arg_parser.parse_args()
+
+full_tagger=ParagraphWebLanguageScoreRetagger()
+early_stop_tagger=ParagraphWebLanguageScoreRetagger(early_stop_threshold=args.threshold, early_stop_window=args.window,
+                                                    early_stop_z=args.z, early_stop_min_words=args.min_words)
+
+def label(text):
+    return "mittekirjak" if text.meta["whole_text_score"] > args.threshold else "kirjak"
+
+files=[file for file in sorted(os.listdir(args.in_dir)) if file.endswith(".json")]
+full_time=0
+early_stop_time=0
+stopped_early=0
+paragraphs=0
+paragraphs_used=0
+different_labels=[]
+
+for file in files:
+    text = json_to_text(file=os.path.join(args.in_dir, file))
+    start=perf_counter()
+    full_tagger.retag(text)
+    full_time+=perf_counter()-start
+    full_label=label(text)
+
+    text = json_to_text(file=os.path.join(args.in_dir, file))
+    start=perf_counter()
+    early_stop_tagger.retag(text)
+    early_stop_time+=perf_counter()-start
+    early_stop_label=label(text)
+
+    stopped_early+=text.meta["early_stop"]
+    paragraphs+=len(text.paragraphs)
+    paragraphs_used+=text.meta["paragraphs_used"]
+    if full_label != early_stop_label:
+        different_labels.append((file, full_label, early_stop_label))
+
+print("Threshold:",args.threshold,"window:",args.window,"z:",args.z)
+print("Files:",len(files),"stopped early:",stopped_early)
+print("Paragraphs:",paragraphs,"used:",paragraphs_used)
+print("Time: full {:.2f} s, early-stop {:.2f} s".format(full_time, early_stop_time))
+print("Different labels:",len(different_labels))
+for file, full_label, early_stop_label in different_labels:
+    print("  ",file,"full:",full_label,"early-stop:",early_stop_label)
@@ -0,0 +1,77 @@
+# This script is for testing purposes.
+# Scores the files from folder "kirjak_vs_mittekirjak_ettenten_tagged" with paragraphweblanguagescoreretagger without
+# and with a paragraph cache (see paragraph_cache.py), checks that the counts of the paragraphs are the same, and reports
+# the time of both runs and the hit rates of the cache per domain. Files are scored twice with the cache: in the first
+# pass paragraphs repeated across pages of a domain are answered from the cache, in the second pass all paragraphs are.
+# Also checks that a paragraph in two documents with different compound tokens (unknown words depend on the compound
+# tokens of the whole document) gets the counts of scoring without a cache in both documents, and so does a paragraph
+# with a different paragraph before and after it (matches of the web language patterns can run across paragraphs).
+
+import os
+import argparse
+from time import perf_counter
+from estnltk.converters import json_to_text
+from estnltk import Text
+from paragraph_cache import ParagraphCache, domain_of
+from paragraphweblanguagescoreretagger import ParagraphWebLanguageScoreRetagger
+from process_and_save_results import layer_plan, add_layers
+
+
+arg_parser = argparse.ArgumentParser(description='Compares scoring with a paragraph cache with scoring without a cache.')
+arg_parser.add_argument('--in_dir', default='kirjak_vs_mittekirjak_ettenten_tagged',
+                        help='folder of tagged json-files (output of process_and_save_results.py)')
+arg_parser.add_argument('--cache_size', type=int, default=100000, help='number of paragraphs kept in memory')
+arg_parser.add_argument('--domains', type=int, default=20, help='number of domains in the table of hit rates')
+args = arg_parser.parse_args()
+
+files=[file for file in sorted(os.listdir(args.in_dir)) if file.endswith(".json")]
+texts={file: json_to_text(file=os.path.join(args.in_dir, file)) for file in files}
+
+cache=ParagraphCache(max_size=args.cache_size)
+full_tagger=ParagraphWebLanguageScoreRetagger()
+cached_tagger=ParagraphWebLanguageScoreRetagger(cache=cache)
+
+start=perf_counter()
+reference={file: full_tagger.paragraph_features(text) for file, text in texts.items()}
+times={"without cache": perf_counter()-start}
+
+mismatches=0
+for run in ("with cache, first pass", "with cache, second pass"):
+    start=perf_counter()
+    results={file: cached_tagger.paragraph_features(text, domain=domain_of(file)) for file, text in texts.items()}
+    times[run]=perf_counter()-start
+    for file, features in results.items():
+        different=(features.matrix != reference[file].matrix).any(axis=1).sum()
+        if different:
+            print(run+": counts of",different,"paragraphs differ:",file)
+            mismatches+=1
+    if run == "with cache, first pass":
+        # hit rates of the first pass (in the second pass every paragraph is a hit)
+        hit_rates=cache.statistics.report(args.domains)
+
+for run, t in times.items():
+    print("{:<26}{:>8.2f} s".format(run+":", t))
+print()
+print("Hit rates of the first pass:")
+print(hit_rates)
+print()
+# the same paragraph in different documents (document, number of the paragraph): with a URL and an e-mail address 
+# in the other paragraph and without them; at the end of the document and before another paragraph 
+# (the pattern of foreign letters takes the last word and runs into the next paragraph, where it is not counted)
+documents=[("Tere xqztkv sõber.\n\nVaata ka www.example.ee või kirjuta info@example.ee", 0), 
+           ("Tere xqztkv sõber.\n\nVaata ka meie kodulehte", 0), 
+           ("Tere!\n\nKirjuta mulle xyz", 1), 
+           ("Kirjuta mulle xyz\n\nTere!", 0)]
+context_tagger=ParagraphWebLanguageScoreRetagger(cache=ParagraphCache(max_size=args.cache_size))
+for document, paragraph in documents:
+    text=Text(document)
+    add_layers(text, layer_plan(['weblang'])[0])
+    cached_counts=context_tagger.paragraph_features(text).matrix[paragraph]
+    full_counts=full_tagger.paragraph_features(text).matrix[paragraph]
+    if (cached_counts != full_counts).any():
+        print("counts of the same paragraph differ in another document:",repr(document))
+        mismatches+=1
+
+print(len(files),"files and",len(documents),"documents with the same paragraphs checked,",mismatches,"differences found.")
+if mismatches != 0:
+    raise SystemExit(1)
@@ -0,0 +1,67 @@
+# This script is for testing purposes.
+# Checks that paragraphweblanguagescoreretagger still gives the same results on files from folder "kirjak_vs_mittekirjak_ettenten_tagged".
+# Total scores of every file are compared with file "weblang_scores.csv".
+# Per-paragraph scores can be saved with one version of the retagger (--save) and compared later with another version (--compare).
+
+import os
+import csv
+import json
+import argparse
+from estnltk.converters import json_to_text
+from paragraphweblanguagescoreretagger import ParagraphWebLanguageScoreRetagger
+
+
+arg_parser = argparse.ArgumentParser(description='Compares results of paragraphweblanguagescoreretagger with previously saved results.')
+arg_parser.add_argument('--in_dir', default='kirjak_vs_mittekirjak_ettenten_tagged',
+                        help='folder of tagged json-files (output of process_and_save_results.py)')
+arg_parser.add_argument('--scores', default='weblang_scores.csv',
+                        help='csv-file with total scores of files (output of retagger_results_kirjak_vs_mittekirjak_to_csv.py)')
+arg_parser.add_argument('--save', default=None, help='saves per-paragraph scores of all files into this json-file')
+arg_parser.add_argument('--compare', default=None, help='compares per-paragraph scores with scores saved into this json-file')
+args = arg_parser.parse_args()
+
+weblang_tagger=ParagraphWebLanguageScoreRetagger(use_punct_reps=True)
+
+total_scores={} # total scores of files from csv-file
+with open(args.scores, newline='') as f:
+    reader = csv.DictReader(f, delimiter=';', quoting=csv.QUOTE_NONE)
+    for row in reader:
+        total_scores[row["filename"]]=row
+
+saved_scores={}
+if args.compare:
+    with open(args.compare, 'r', encoding='utf-8') as f:
+        saved_scores=json.load(f)
+
+paragraph_scores={} # per-paragraph scores of all files
+mismatches=0
+
+for file in sorted(os.listdir(args.in_dir)):
+    if not file.endswith(".json"):
+        continue
+    text = json_to_text(file=os.path.join(args.in_dir, file))
+    weblang_tagger.retag(text)
+
+    scores={attr: list(text.paragraphs[attr]) for attr in weblang_tagger.output_attributes}
+    scores["whole_text_score"]=text.meta["whole_text_score"]
+    paragraph_scores[file]=scores
+
+    if file in total_scores:
+        for attr in weblang_tagger.output_attributes:
+            if sum(scores[attr]) != int(total_scores[file][attr]):
+                print("Total score differs:",file,attr,sum(scores[attr]),"!=",total_scores[file][attr])
+                mismatches+=1
+
+    if file in saved_scores:
+        for attr, values in saved_scores[file].items():
+            if scores.get(attr) != values:
+                print("Paragraph scores differ:",file,attr,scores.get(attr),"!=",values)
+                mismatches+=1
+
+if args.save:
+    with open(args.save, 'w', encoding='utf-8') as f:
+        json.dump(paragraph_scores, f, ensure_ascii=False, indent=1)
+
+print(len(paragraph_scores),"files checked,",mismatches,"differences found.")
+if mismatches != 0:
+    raise SystemExit(1)
@@ -0,0 +1,61 @@
+# This script is for testing purposes.
+# Checks that documents written into a container of text_container.py are read back unchanged: a writer made with
+# default settings (compression chosen by default_compression()) and writers with every compression method.
+# Documents are made here (a words layer and an ambiguous morph_analysis layer), so no input folder is needed.
+
+import os
+import json
+import shutil
+import tempfile
+from text_container import TextContainerWriter, TextContainerReader, default_compression
+
+
+def make_text_dict(i):
+    """Returns a text dict like estnltk.converters.text_to_dict makes, with words and morph_analysis layers."""
+    text="Tere, maailm nr {}! Kuidas läheb?".format(i)
+    words=[(0, 4), (4, 5), (6, 12), (13, 15), (16, 16+len(str(i))), (16+len(str(i)), 17+len(str(i)))]
+    words_layer={'name': 'words', 'attributes': ['normalized_form'], 'parent': None, 'enveloping': None,
+                 'ambiguous': True, 'serialisation_module': None, 'meta': {},
+                 'spans': [{'base_span': list(span), 'annotations': [{'normalized_form': None}]} for span in words]}
+    morph_layer={'name': 'morph_analysis', 'attributes': ['lemma', 'root_tokens', 'partofspeech', 'form'],
+                 'parent': 'words', 'enveloping': None, 'ambiguous': True, 'serialisation_module': None, 'meta': {},
+                 'spans': [{'base_span': list(span),
+                            'annotations': [{'lemma': text[span[0]:span[1]].lower(), 'root_tokens': [text[span[0]:span[1]].lower()],
+                                             'partofspeech': 'S', 'form': form} for form in (['sg n', 'sg g'] if j % 2 else ['sg n'])]}
+                           for j, span in enumerate(words)]}
+    return {'text': text, 'meta': {'id': i}, 'layers': [words_layer, morph_layer]}
+
+
+documents={'doc_{}.json'.format(i): make_text_dict(i) for i in range(5)}
+failures=0
+for compression in (None, 'gzip', 'zstd', 'none'):
+    if compression == 'zstd' and default_compression() != 'zstd':
+        print("zstd: skipped (module zstandard is not installed)")
+        continue
+    out_dir=tempfile.mkdtemp()
+    try:
+        # shards of 2 documents, so that the last shard is closed by close()
+        writer=TextContainerWriter(out_dir) if compression is None else TextContainerWriter(out_dir, shard_size=2, compression=compression)
+        with writer:
+            for doc_id, text_dict in documents.items():
+                writer.add(doc_id, text_dict)
+        with TextContainerReader(out_dir) as reader:
+            differences=[doc_id for doc_id, text_dict in documents.items() if reader.text_dict(doc_id) != text_dict]
+            only_words=reader.text_dict('doc_1.json', layers=['words'])['layers'] == [documents['doc_1.json']['layers'][0]]
+            count=len(reader)
+        shard_compressions=set()
+        for file in os.listdir(out_dir):
+            if file.endswith('.index.json'):
+                with open(os.path.join(out_dir, file), 'r', encoding='utf-8') as f:
+                    shard_compressions.add(json.load(f)['compression'])
+    finally:
+        shutil.rmtree(out_dir)
+    name=compression if compression is not None else "default ({})".format(default_compression())
+    expected=compression if compression is not None else default_compression()
+    ok=not differences and only_words and count == len(documents) and shard_compressions == {expected}
+    print("{:<16} {}".format(name+":", "ok" if ok else "FAILED: differences {}, layers {}, documents {}, compressions {}".format(
+          differences, only_words, count, shard_compressions)))
+    failures+=not ok
+
+if failures:
+    raise SystemExit(1)
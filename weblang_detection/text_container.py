@@ -0,0 +1,224 @@
+# Compact container format for tagged Text objects (an alternative to one EstNLTK JSON export file per document).
+#
+# A container is a folder of shards. Every shard consists of two files:
+#   <prefix>_00000.bin         -- documents, every document is compressed separately (by default zstd if the module
+#                                 zstandard can be imported, otherwise gzip), so that a document can be read without the others;
+#   <prefix>_00000.index.json  -- offsets of the documents in the .bin file and the value dictionaries of the shard.
+# Layers are stored by columns: base spans of the layer, numbers of annotations of the spans and a list of value ids
+# for every attribute. Values of an attribute (e.g. partofspeech, form, ending) are dictionary-encoded: every distinct
+# value is stored once in the index of the shard. The index is written when the shard is closed, so a .bin file
+# without an index (e.g. from a crashed run) is not read.
+
+import os
+import json
+import gzip
+
+
+def default_compression():
+    """Returns 'zstd' if the module zstandard can be imported, otherwise 'gzip'."""
+    try:
+        import zstandard
+    except ImportError:
+        return 'gzip'
+    return 'zstd'
+
+
+def compressor(compression):
+    """Returns functions (compress, decompress) of the compression method 'gzip', 'zstd' or 'none'."""
+    if compression == 'none':
+        return bytes, bytes
+    if compression == 'gzip':
+        return (lambda data: gzip.compress(data, compresslevel=6)), gzip.decompress
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=3).compress, zstandard.ZstdDecompressor().decompress
+    raise ValueError("compression should be 'gzip', 'zstd' or 'none', not {!r}".format(compression))
+
+
+class ValueDictionary:
+    """Distinct values of every attribute of a shard. Values are stored as JSON strings, so that lists and dicts
+       (e.g. root_tokens of morph_analysis) can also be values."""
+
+    def __init__(self, values=None):
+        self.values=values if values is not None else {}
+        # ids are only needed for writing, when values are collected by encode()
+        self.ids={}
+        self.decoded={}
+
+    def encode(self, attr, value):
+        key=json.dumps(value, ensure_ascii=False)
+        ids=self.ids.setdefault(attr, {})
+        value_id=ids.get(key)
+        if value_id is None:
+            value_id=ids[key]=len(ids)
+            self.values.setdefault(attr, []).append(key)
+        return value_id
+
+    def decoder(self, attr):
+        """Returns the list of the values of the attribute (parsed once per shard)."""
+        values=self.decoded.get(attr)
+        if values is None:
+            values=self.decoded[attr]=[json.loads(value) for value in self.values.get(attr, [])]
+        return values
+
+
+def encode_layer(layer_dict, dictionary):
+    """Converts a layer dict (EstNLTK's default serialisation) into the columnar form."""
+    encoded={key: value for key, value in layer_dict.items() if key != 'spans'}
+    encoded['base_spans']=[span['base_span'] for span in layer_dict['spans']]
+    encoded['annotation_counts']=[len(span['annotations']) for span in layer_dict['spans']]
+    encoded['values']={attr: [dictionary.encode(attr, annotation.get(attr))
+                              for span in layer_dict['spans'] for annotation in span['annotations']]
+                       for attr in layer_dict['attributes']}
+    return encoded
+
+
+def decode_layer(encoded, dictionary):
+    """Converts a layer from the columnar form back into a layer dict."""
+    layer_dict={key: value for key, value in encoded.items() if key not in ('base_spans', 'annotation_counts', 'values')}
+    attrs=list(encoded['values'])
+    columns=[]
+    for attr in attrs:
+        values=dictionary.decoder(attr)
+        column=[values[i] for i in encoded['values'][attr]]
+        if any(isinstance(value, (list, dict)) for value in values):
+            # every annotation gets its own (shallow) copy of a list or dict value, as when loading JSON
+            column=[list(value) if isinstance(value, list) else dict(value) if isinstance(value, dict) else value for value in column]
+        columns.append(column)
+    annotations=[dict(zip(attrs, row)) for row in zip(*columns)] if attrs else [{} for i in range(sum(encoded['annotation_counts']))]
+    spans=[]
+    i=0
+    for base_span, count in zip(encoded['base_spans'], encoded['annotation_counts']):
+        spans.append({'base_span': base_span, 'annotations': annotations[i:i+count]})
+        i+=count
+    layer_dict['spans']=spans
+    return layer_dict
+
+
+class TextContainerWriter:
+    """Writes text dicts (made by estnltk.converters.text_to_dict) into shards of a container folder.
+       A shard is closed (and its index written) after shard_size documents. If compression is None, 
+       default_compression() is used (the compression of a shard is stored in its index)."""
+
+    def __init__(self, out_dir, prefix='shard', shard_size=1000, compression=None):
+        self.out_dir=out_dir
+        self.prefix=prefix
+        self.shard_size=shard_size
+        self.compression=compression if compression is not None else default_compression()
+        self.compress=compressor(self.compression)[0]
+        # shards of earlier runs are kept; a .bin file without an index is overwritten
+        self.shard_number=0
+        while os.path.exists(self._shard_path(self.shard_number, '.index.json')):
+            self.shard_number+=1
+        self.shard=None
+
+    def _shard_path(self, number, ext):
+        return os.path.join(self.out_dir, '{}_{:05d}{}'.format(self.prefix, number, ext))
+
+    def current_shard(self):
+        """Returns the path of the shard where the next document is written."""
+        return self._shard_path(self.shard_number, '.bin')
+
+    def add(self, doc_id, text_dict):
+        """Adds a document to the current shard. Returns the list of ids of the documents of the shard
+           if the shard was closed, otherwise an empty list."""
+        if self.shard is None:
+            self.shard=open(self.current_shard(), 'wb')
+            self.documents=[]
+            self.dictionary=ValueDictionary()
+        document={'text': text_dict['text'], 'meta': text_dict['meta'],
+                  'layers': [encode_layer(layer_dict, self.dictionary) for layer_dict in text_dict['layers']]}
+        data=self.compress(json.dumps(document, ensure_ascii=False).encode('utf-8'))
+        self.documents.append([doc_id, self.shard.tell(), len(data)])
+        self.shard.write(data)
+        if len(self.documents) >= self.shard_size:
+            return self.close_shard()
+        return []
+
+    def close_shard(self):
+        """Writes the index of the current shard. Returns the list of ids of the documents of the shard."""
+        if self.shard is None:
+            return []
+        self.shard.close()
+        self.shard=None
+        index={'compression': self.compression, 'documents': self.documents, 'values': self.dictionary.values}
+        index_path=self._shard_path(self.shard_number, '.index.json')
+        with open(index_path+'.tmp', 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+        os.replace(index_path+'.tmp', index_path)
+        self.shard_number+=1
+        return [doc_id for doc_id, offset, length in self.documents]
+
+    def close(self):
+        return self.close_shard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TextContainerReader:
+    """Reads documents from a container folder. Only the indexes of the shards are loaded at first;
+       documents are read and decompressed when they are asked for."""
+
+    def __init__(self, in_dir):
+        self.in_dir=in_dir
+        self.shards=[]
+        self.files={}
+        self.locations={}
+        for file in sorted(os.listdir(in_dir)):
+            if file.endswith('.index.json'):
+                with open(os.path.join(in_dir, file), 'r', encoding='utf-8') as f:
+                    index=json.load(f)
+                shard=len(self.shards)
+                self.shards.append({'path': os.path.join(in_dir, file[:-len('.index.json')]+'.bin'),
+                                    'decompress': compressor(index['compression'])[1],
+                                    'dictionary': ValueDictionary(index['values'])})
+                for doc_id, offset, length in index['documents']:
+                    self.locations[doc_id]=(shard, offset, length)
+
+    def __len__(self):
+        return len(self.locations)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files={}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, doc_id):
+        return doc_id in self.locations
+
+    def doc_ids(self):
+        return list(self.locations)
+
+    def text_dict(self, doc_id, layers=None):
+        """Returns the text dict of a document (as estnltk.converters.text_to_dict makes it).
+           If layers is given, only these layers are decoded."""
+        shard_number, offset, length=self.locations[doc_id]
+        shard=self.shards[shard_number]
+        f=self.files.get(shard_number)
+        if f is None:
+            f=self.files[shard_number]=open(shard['path'], 'rb')
+        f.seek(offset)
+        document=json.loads(shard['decompress'](f.read(length)).decode('utf-8'))
+        document['layers']=[decode_layer(encoded, shard['dictionary']) for encoded in document['layers']
+                            if layers is None or encoded['name'] in layers]
+        return document
+
+    def text(self, doc_id, layers=None):
+        """Returns the document as a Text object."""
+        from estnltk.converters import dict_to_text
+        return dict_to_text(self.text_dict(doc_id, layers))
+
+    def texts(self, layers=None):
+        """Yields (doc_id, Text) pairs of all documents, reading one document at a time."""
+        for doc_id in self.locations:
+            yield doc_id, self.text(doc_id, layers)
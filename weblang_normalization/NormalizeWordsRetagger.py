@@ -5,7 +5,6 @@ from estnltk import Text, Annotation
 from estnltk.taggers.morph_analysis.morf_common import _get_word_text
 from itertools import groupby
 from estnltk.taggers.morph_analysis.proxy import MorphAnalyzedToken
-import nltk
 
 class NormalizeWordsRetagger(Retagger):
     """Retagger for adding normalized forms as attributes of words layer for words of Estonian Internet language, particularly the language characteristic to etTenTen."""
@@ -38,7 +37,16 @@ class NormalizeWordsRetagger(Retagger):
             output_attributes=output_attributes
 
         self.output_attributes=output_attributes
-        self._english_words = set(nltk.corpus.words.words())
+        # English words (nltk's words corpus) are loaded on first use (see english_words)
+        self._english_words = set()
+        
+    @property
+    def english_words(self):
+        """Set of English words from nltk's words corpus. Is loaded on first use, because importing nltk is slow."""
+        if not self._english_words:
+            import nltk
+            self._english_words.update(nltk.corpus.words.words())
+        return self._english_words
         
 
     def _change_layer(self, text, layers, status):
@@ -479,8 +487,8 @@ class NormalizeWordsRetagger(Retagger):
                         if len(words)-1>word_id:
                             next_word=words[word_id+1]
                         if (candidate[0].isupper() and (w.start>2 and words.text[w.start-2:w.start-1] in ["!","?","."])) \
-                        or (candidate in self._english_words and ((not type(prev_word) is str and prev_word.text in self._english_words) \
-                                                            or (not type(next_word) is str and next_word.text in self._english_words))) \
+                        or (candidate in self.english_words and ((not type(prev_word) is str and prev_word.text in self.english_words) \
+                                                            or (not type(next_word) is str and next_word.text in self.english_words))) \
                         or (MorphAnalyzedToken(candidate.capitalize()).is_word==True):
                             continue
                         else: